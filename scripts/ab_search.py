@@ -0,0 +1,172 @@
+import os
+import sys
+import time
+import numpy as np
+from gf2_linalg import solve
+from mm_scheme import MM_Scheme, mm_tensor
+from scheme_index import SchemeIndex
+
+# Search over F_2 that only enumerates alpha and beta. Term l contributes the
+# rank one column alpha_l (x) beta_l (bit a * mp + b, a Python int) and with
+# these fixed the gammas solve M g_c = T_c for every gamma entry c, M having
+# the columns and T_c the (nm x mp) slice of the MM tensor. Without loss of
+# generality the columns are independent (a dependent column lets its gamma be
+# pushed onto the others, dropping a term), so a scheme of rank <= r exists
+# iff some r dimensional space W containing every T_c has a basis of rank
+# one columns. W is T plus r - dim T further rank one columns, which are
+# enumerated depth first while W and its elements grow incrementally. By the
+# symmetries (alpha, beta) -> (P alpha Q, Q^-1 beta R) of the MM tensor the
+# first of them is an orbit representative. This is exhaustive, so it only
+# suits small cases, where it also proves nonexistence.
+
+def int_bits(keys, size: int) -> np.ndarray:
+    # (N,) ints -> (N, size) bool, bit i of key k
+    return ((np.asarray(keys, dtype=np.int64)[:, None] >> np.arange(size)) & 1).astype(bool)
+
+def bits_int(bits) -> np.ndarray:
+    # (N, size) bool -> (N,) ints, the inverse of int_bits
+    return (np.asarray(bits, dtype=np.int64) << np.arange(bits.shape[1])).sum(axis=1)
+
+def column(u: int, v: int, mp: int) -> int:
+    # alpha (x) beta for alpha and beta given by their bits
+    x = 0
+    a = 0
+    while u:
+        if u & 1:
+            x |= v << (a * mp)
+        u >>= 1
+        a += 1
+    return x
+
+def orbit_representatives(n, m, p) -> np.ndarray:
+    # Candidate index (u - 1) * (2^mp - 1) + v - 1 of the first pair in every
+    # orbit of the transvections generating P, Q and R
+    nm, mp = n * m, m * p
+    u, v = np.divmod(np.arange((2**nm - 1) * (2**mp - 1)), 2**mp - 1)
+    U = int_bits(u + 1, nm).reshape(-1, n, m)
+    V = int_bits(v + 1, mp).reshape(-1, m, p)
+    generators = []
+    for i in range(n):
+        for j in range(n):
+            if i != j:
+                X = U.copy()
+                X[:, i] ^= U[:, j]
+                generators.append((X, V))
+    for i in range(m):
+        for j in range(m):
+            if i != j:
+                X, Y = U.copy(), V.copy()
+                X[:, :, j] ^= U[:, :, i]
+                Y[:, i] ^= V[:, j]
+                generators.append((X, Y))
+    for i in range(p):
+        for j in range(p):
+            if i != j:
+                Y = V.copy()
+                Y[:, :, j] ^= V[:, :, i]
+                generators.append((U, Y))
+    moves = [(bits_int(X.reshape(len(X), -1)) - 1) * (2**mp - 1) + bits_int(Y.reshape(len(Y), -1)) - 1
+             for X, Y in generators]
+    # Transvections are involutions, so taking the minimum label along every
+    # move until nothing changes labels each orbit by its smallest index
+    labels = np.arange(len(u))
+    while True:
+        new = labels
+        for move in moves:
+            new = np.minimum(new, new[move])
+        new = new[new]
+        if np.array_equal(new, labels):
+            return np.unique(labels)
+        labels = new
+
+def insert(basis, x):
+    # Reduce x against an xor basis (pivot, vector) sorted by decreasing
+    # pivot, returns the extended basis or None if x is in its span
+    for pivot, b in basis:
+        if x >> pivot & 1:
+            x ^= b
+    if not x:
+        return None
+    return sorted(basis + [(x.bit_length() - 1, x)], reverse=True)
+
+def ab_search(n, m, p, r, limit=1):
+    # Up to limit schemes over F_2 of rank <= r (zero terms dropped), an
+    # empty list proves there are none
+    nm, mp = n * m, m * p
+    T = mm_tensor(n, m, p).reshape(nm * mp, -1)
+    basis = []
+    for x in [sum(1 << int(i) for i in np.flatnonzero(T[:, c])) for c in range(T.shape[1])]:
+        basis = insert(basis, x) or basis
+    outside = r - len(basis)
+    if outside < 0:
+        return []
+    num_v = 2**mp - 1
+    columns = [column(u, v, mp) for u in range(1, 2**nm) for v in range(1, 2**mp)]
+    rank_one = {x: idx for idx, x in enumerate(columns)}
+    span = [0]
+    for _, b in basis:
+        span += [x ^ b for x in span]
+    schemes = []
+
+    def scheme(chosen) -> MM_Scheme:
+        u, v = np.divmod(np.array(chosen), num_v)
+        U = int_bits(u + 1, nm).reshape(-1, n, m)
+        V = int_bits(v + 1, mp).reshape(-1, m, p)
+        A = np.stack([U[l].reshape(-1)[:, None] & V[l].reshape(-1)[None, :] for l in range(len(chosen))], axis=-1)
+        A = A.reshape(nm * mp, -1)
+        W = np.stack([solve(A, T[:, c])[0] for c in range(T.shape[1])], axis=1)
+        return MM_Scheme(U, V, W.reshape(-1, n, p)).drop_zero_terms()
+
+    def leaf(span):
+        # A basis of W from its rank one elements, if they span it
+        chosen, leaf_basis = [], []
+        for x in span:
+            if x in rank_one:
+                extended = insert(leaf_basis, x)
+                if extended is not None:
+                    leaf_basis = extended
+                    chosen.append(rank_one[x])
+        if len(chosen) == r:
+            schemes.append(scheme(chosen))
+
+    def extend(start, basis, span, depth):
+        if depth == outside:
+            leaf(span)
+            return
+        first = orbit_representatives(n, m, p).tolist() if depth == 0 else range(start, len(columns))
+        for idx in first:
+            if len(schemes) >= limit:
+                return
+            x = columns[idx]
+            extended = insert(basis, x)
+            if extended is None:
+                continue
+            extend(idx + 1 if depth else 0, extended, span + [y ^ x for y in span], depth + 1)
+
+    extend(0, basis, span, 0)
+    return schemes
+
+def main():
+    flags = dict((arg[2:].split('=', 1) + [None])[:2] for arg in sys.argv[1:] if arg.startswith('--'))
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if len(args) < 4:
+        print(f'Usage : \'python3 {sys.argv[0]} dim1 dim2 dim3 rank [--limit=1] [--out=<dir>] [--index=<schemes.db>]\'')
+        sys.exit(1)
+    n, m, p, r = [int(x) for x in args[:4]]
+    t0 = time.time()
+    schemes = ab_search(n, m, p, r, int(flags.get('limit') or 1))
+    print(f'{len(schemes)} schemes of rank <= {r} in {time.time() - t0:.2f} seconds')
+    # Schemes already in the index are equivalent to a known one and not saved
+    index = SchemeIndex(flags['index'], 'F2') if flags.get('index') else None
+    for idx, scheme in enumerate(schemes):
+        if not scheme.is_valid('F2'):
+            raise RuntimeError('Search produced an invalid scheme')
+        out = flags.get('out') or 'schemes'
+        filename = os.path.join(out, f'{n}{m}{p}_r{scheme.rank}_ab{idx}.npz')
+        if index is not None and not index.add(scheme, filename)[1]:
+            continue
+        os.makedirs(out, exist_ok=True)
+        scheme.save(filename)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import os
+import sys
+import time
+import numpy as np
+from mm_scheme import FIELDS, MM_Scheme, mm_tensor
+from scheme_index import SchemeIndex
+
+# Alternating least squares on the MM tensor for a batch of random restarts
+# at once. Factors are (restarts, entries, r) arrays, so every update is a
+# batched r x r solve. Halfway through, a penalty pulls the factors towards
+# their nearest allowed coefficient, which makes the final rounding far more
+# likely to land on an exact scheme. Rounded candidates are only returned if
+# they verify exactly.
+
+def nearest(x, coefficients) -> np.ndarray:
+    values = np.asarray(sorted(coefficients), dtype=np.float64)
+    return values[np.abs(x[..., None] - values).argmin(axis=-1)]
+
+def _update(T, X, Y, target, reg, pull):
+    # Least squares for the factor opposite X and Y: T ~ sum_r F (x) X (x) Y,
+    # with a Tikhonov term reg |F|^2 and pull |F - target|^2
+    M = np.einsum('ijk,sjr,skr->sir', T, X, Y)
+    G = np.einsum('sjr,sjq->srq', X, X) * np.einsum('skr,skq->srq', Y, Y)
+    G += (reg + pull) * np.eye(G.shape[-1])
+    if pull:
+        M = M + pull * target
+    return np.linalg.solve(G, M.transpose(0, 2, 1)).transpose(0, 2, 1)
+
+def balance(A, B, C):
+    # Rescale every term so its three factors have equal norms, the scaling
+    # that makes a term's entries roundable
+    norms = [np.linalg.norm(X, axis=1, keepdims=True) + 1e-12 for X in (A, B, C)]
+    geometric = np.cbrt(norms[0] * norms[1] * norms[2])
+    return A * geometric / norms[0], B * geometric / norms[1], C * geometric / norms[2]
+
+def als(n, m, p, r, restarts=256, iterations=400, reg=1e-3, pull=0.05, coefficients=(-1, 0, 1), seed=0):
+    # Returns the relative fit error of every restart and the rounded
+    # (restarts, r, entries) factor candidates
+    rng = np.random.default_rng(seed)
+    T = mm_tensor(n, m, p).astype(np.float64)
+    A, B, C = [rng.standard_normal((restarts, size, r)) / np.sqrt(r) for size in (n * m, m * p, n * p)]
+    norm = np.linalg.norm(T)
+    for step in range(iterations):
+        # No pull while the restarts are still finding their basin
+        mu = pull * max(0.0, 2 * step / iterations - 1)
+        A = _update(T, B, C, nearest(A, coefficients), reg, mu)
+        B = _update(T.transpose(1, 0, 2), A, C, nearest(B, coefficients), reg, mu)
+        C = _update(T.transpose(2, 0, 1), A, B, nearest(C, coefficients), reg, mu)
+        A, B, C = balance(A, B, C)
+    error = np.sqrt(((np.einsum('sir,sjr,skr->sijk', A, B, C) - T) ** 2).sum(axis=(1, 2, 3))) / norm
+    rounded = [nearest(X, coefficients).astype(np.int8).transpose(0, 2, 1) for X in (A, B, C)]
+    return error, rounded
+
+def als_schemes(n, m, p, r, field='Z', **options) -> list:
+    # Distinct rounded candidates that are exact schemes over the field
+    if field not in FIELDS:
+        raise ValueError(f'Invalid field: {field}')
+    _, (U, V, W) = als(n, m, p, r, **options)
+    schemes = []
+    seen = set()
+    for s in range(len(U)):
+        scheme = MM_Scheme(U[s].reshape(r, n, m), V[s].reshape(r, m, p), W[s].reshape(r, n, p))
+        if not scheme.is_valid(field):
+            continue
+        scheme = scheme.drop_zero_terms()
+        key = b''.join(X.tobytes() for X in (scheme.U, scheme.V, scheme.W))
+        if key not in seen:
+            seen.add(key)
+            schemes.append(scheme)
+    return schemes
+
+def main():
+    flags = dict(arg[2:].split('=', 1) for arg in sys.argv[1:] if arg.startswith('--') and '=' in arg)
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if len(args) < 4:
+        print(f'Usage : \'python3 {sys.argv[0]} dim1 dim2 dim3 rank [--restarts=256] [--iterations=400] [--reg=1e-3] '
+              f'[--pull=0.05] [--field=Z|F2] [--seed=0] [--out=<dir>] [--index=<schemes.db>]\'')
+        sys.exit(1)
+    n, m, p, r = [int(x) for x in args[:4]]
+    field = flags.get('field', 'Z')
+    t0 = time.time()
+    schemes = als_schemes(n, m, p, r, field, restarts=int(flags.get('restarts', 256)),
+                          iterations=int(flags.get('iterations', 400)), reg=float(flags.get('reg', 1e-3)),
+                          pull=float(flags.get('pull', 0.05)), seed=int(flags.get('seed', 0)),
+                          coefficients=(-1, 0, 1) if field == 'Z' else (0, 1))
+    print(f'{len(schemes)} exact schemes in {time.time() - t0:.1f} seconds')
+    out = flags.get('out', 'schemes')
+    # Schemes already in the index are equivalent to a known one and not saved
+    index = SchemeIndex(flags['index'], field) if 'index' in flags else None
+    for idx, scheme in enumerate(schemes):
+        filename = os.path.join(out, f'{n}{m}{p}_r{scheme.rank}_als{idx}.npz')
+        if index is not None and not index.add(scheme, filename)[1]:
+            continue
+        os.makedirs(out, exist_ok=True)
+        scheme.save(filename)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+from z3 import Solver
+from brent_cnf import BrentEncoder
+from instance_cache import write_instance
+from ternary_cnf import TernaryEncoder
+from z3_solve import build_solver
+
+# Repeatable timings of the encoders, of posting an encoding to z3
+# (build_solver) and writing it as DIMACS (write_instance) end to end, and of
+# solving the committed DIMACS fixtures, compared against a baseline file.
+# The smoke tier is quick enough to run on every change, the long tier is
+# meant for nightly runs.
+
+# The reference instances committed at the top of the repository
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cnf')
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+TIERS = {
+    'smoke': {
+        'encoders': [('sat', 2, 2, 2, 7), ('sat', 2, 2, 3, 11), ('sat', 3, 3, 3, 23), ('ternary-sat', 2, 2, 2, 7)],
+        'builds': [('sat', 2, 2, 3, 11), ('sat', 3, 3, 3, 23), ('ternary-sat', 2, 2, 2, 7)],
+        'fixtures': ['rank_121_leq_2', 'rank_222_leq_7'],
+        'time_cap': 60,
+        'repeat': 5,
+    },
+    'long': {
+        'encoders': [('sat', 2, 2, 2, 7), ('sat', 2, 2, 3, 11), ('sat', 2, 3, 3, 15), ('sat', 3, 3, 3, 23),
+                     ('sat', 4, 4, 4, 49), ('ternary-sat', 2, 2, 2, 7), ('ternary-sat', 3, 3, 3, 23)],
+        'builds': [('sat', 2, 2, 3, 11), ('sat', 3, 3, 3, 23), ('sat', 4, 4, 4, 49), ('ternary-sat', 2, 2, 2, 7),
+                   ('ternary-sat', 3, 3, 3, 23)],
+        'fixtures': ['rank_121_leq_2', 'rank_222_leq_6', 'rank_222_leq_7', 'rank_223_leq_10', 'rank_223_leq_11',
+                     'rank_333_leq_23'],
+        'time_cap': 1800,
+        'repeat': 1,
+    },
+}
+
+# Differences below these are timer and allocator noise, never regressions
+NOISE = {'seconds': 0.01, 'peak_bytes': 2**16}
+# Timings this short in the baseline are mostly noise and not compared
+MIN_SECONDS = 0.1
+# Constraints of the build and write entries, the expensive families on
+BUILD_OPTIONS = {'lex': True, 'lex_gamma': False, 'sign_sym': True, 'valid_ineq': True, 'cardinality': 'totalizer'}
+
+def measure(function, repeat=1):
+    # Best wall time over the repeats and the peak traced memory of one run
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak, result
+
+def bench_encoder(mode, n, m, p, r, repeat=1) -> dict:
+    def encode():
+        encoder = BrentEncoder(n, m, p, r) if mode == 'sat' else TernaryEncoder(n, m, p, r)
+        clauses = sum(len(chunk) for chunk in encoder.clauses())
+        return clauses, encoder.num_vars
+    seconds, peak, (clauses, num_vars) = measure(encode, repeat)
+    return {'seconds': seconds, 'peak_bytes': peak, 'clauses': clauses, 'variables': num_vars}
+
+def bench_build(mode, n, m, p, r, repeat=1) -> dict:
+    # Encoding and posting to z3, what exists_scheme does before it solves
+    coefficients = [0, 1] if mode == 'sat' else [-1, 0, 1]
+    def build():
+        build_solver(n, m, p, r, mode, coefficients, **BUILD_OPTIONS)
+    seconds, peak, _ = measure(build, repeat)
+    return {'seconds': seconds, 'peak_bytes': peak}
+
+def bench_write(mode, n, m, p, r, repeat=1) -> dict:
+    # Encoding and writing the DIMACS file with its variable map
+    with tempfile.TemporaryDirectory() as directory:
+        def write():
+            return write_instance(os.path.join(directory, 'instance.cnf'), n, m, p, r, ternary=mode == 'ternary-sat',
+                                  **BUILD_OPTIONS)
+        seconds, peak, (num_vars, clauses) = measure(write, repeat)
+    return {'seconds': seconds, 'peak_bytes': peak, 'clauses': clauses, 'variables': num_vars}
+
+def bench_fixture(name, time_cap, seed=0) -> dict:
+    # z3 has no notion of peak memory from outside, its own statistic is used
+    solver = Solver()
+    solver.set(random_seed=seed, timeout=int(time_cap * 1000))
+    solver.from_file(os.path.join(FIXTURE_DIR, f'{name}.cnf'))
+    t0 = time.perf_counter()
+    result = str(solver.check())
+    seconds = time.perf_counter() - t0
+    statistics = solver.statistics()
+    memory = statistics.get_key_value('max memory') if 'max memory' in statistics.keys() else None
+    return {'seconds': seconds, 'result': result, 'max_memory_mb': memory}
+
+def run_tier(tier: str) -> dict:
+    spec = TIERS[tier]
+    results = {}
+    for mode, n, m, p, r in spec['encoders']:
+        key = f'encode {mode} {n}{m}{p} r={r}'
+        results[key] = bench_encoder(mode, n, m, p, r, spec['repeat'])
+        print(f'{key:>32}: {results[key]["seconds"]:.3f}s, {results[key]["peak_bytes"] / 2**20:.1f} MiB')
+    for mode, n, m, p, r in spec['builds']:
+        for step, bench in (('build', bench_build), ('write', bench_write)):
+            key = f'{step} {mode} {n}{m}{p} r={r}'
+            results[key] = bench(mode, n, m, p, r, spec['repeat'])
+            print(f'{key:>32}: {results[key]["seconds"]:.3f}s, {results[key]["peak_bytes"] / 2**20:.1f} MiB')
+    for name in spec['fixtures']:
+        key = f'solve {name}'
+        results[key] = bench_fixture(name, spec['time_cap'])
+        print(f'{key:>32}: {results[key]["seconds"]:.3f}s, {results[key]["result"]}')
+    return results
+
+def compare(results: dict, baseline: dict, threshold=0.25) -> list:
+    # Entries that got slower or bigger than the baseline by more than the
+    # threshold (a fraction) and the noise floor, or whose solver answer
+    # changed. Timings under MIN_SECONDS in the baseline are skipped.
+    regressions = []
+    for key, current in results.items():
+        if key not in baseline:
+            continue
+        reference = baseline[key]
+        for metric in ('seconds', 'peak_bytes', 'max_memory_mb'):
+            old, new = reference.get(metric), current.get(metric)
+            if metric == 'seconds' and old is not None and old < MIN_SECONDS:
+                continue
+            if old and new is not None and new > old * (1 + threshold) and new - old > NOISE.get(metric, 0):
+                regressions.append(f'{key}: {metric} {old:.4g} -> {new:.4g} (+{100 * (new / old - 1):.0f}%)')
+        if 'result' in reference and reference['result'] in ('sat', 'unsat') and current['result'] != reference['result']:
+            regressions.append(f'{key}: result {reference["result"]} -> {current["result"]}')
+    return regressions
+
+def load_baseline(filename: str, tier: str) -> dict:
+    if not os.path.exists(filename):
+        return {}
+    with open(filename) as file:
+        return json.load(file).get(tier, {}).get('results', {})
+
+def save_baseline(filename: str, tier: str, results: dict) -> None:
+    baselines = {}
+    if os.path.exists(filename):
+        with open(filename) as file:
+            baselines = json.load(file)
+    baselines[tier] = {'machine': platform.node(), 'python': platform.python_version(), 'numpy': np.__version__,
+                       'date': time.strftime('%Y-%m-%d'), 'results': results}
+    with open(filename, 'w') as file:
+        json.dump(baselines, file, indent=2, sort_keys=True)
+
+def main():
+    flags = dict((arg[2:].split('=', 1) + [None])[:2] for arg in sys.argv[1:] if arg.startswith('--'))
+    tier = flags.get('tier') or 'smoke'
+    if tier not in TIERS:
+        print(f'Usage : \'python3 {sys.argv[0]} [--tier=smoke|long] [--baseline=<file.json>] [--threshold=0.25] '
+              f'[--update-baseline]\'')
+        sys.exit(1)
+    filename = flags.get('baseline') or DEFAULT_BASELINE
+    threshold = float(flags.get('threshold') or 0.25)
+    results = run_tier(tier)
+    if 'update-baseline' in flags:
+        save_baseline(filename, tier, results)
+        print(f'Baseline for {tier} written to {filename}')
+        return
+    baseline = load_baseline(filename, tier)
+    if not baseline:
+        print(f'No {tier} baseline in {filename}, run with --update-baseline to create one')
+        return
+    regressions = compare(results, baseline, threshold)
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+    if regressions:
+        sys.exit(1)
+    print(f'No regressions beyond {100 * threshold:.0f}%')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+import numpy as np
+from mm_scheme import MM_Scheme, mm_tensor
+
+# Clauses are rows of a zero padded int32 array, one literal per column.
+# Positive entries are variables, negative entries their negations and 0
+# is padding, so a row reads the same way as a DIMACS clause line. Arrays
+# are at least CLAUSE_WIDTH wide, wider when they hold longer clauses.
+CLAUSE_WIDTH = 4
+
+class BrentEncoder:
+    """Tseitin encoding of the Brent equations over F_2 as integer clauses."""
+
+    def __init__(self, n: int, m: int, p: int, r: int, cyclic=None):
+        self.n, self.m, self.p, self.r = n, m, p, r
+        nm, mp, np_ = n * m, m * p, n * p
+        self.cyclic = cyclic
+
+        # Equation e is the flat index of (a entry, b entry, c entry)
+        self.equations = np.arange(nm * mp * np_)
+        self.rhs = mm_tensor(n, m, p).reshape(-1)
+        # Groups of terms that can be permuted freely, for the lex order
+        self.symmetric_terms = [list(range(r))]
+
+        if cyclic is not None:
+            self._cyclic_ansatz(cyclic)
+        else:
+            # Primary variables are numbered term by term, alphas then betas
+            # then gammas, the same order exists_scheme declares them in
+            per_term = nm + mp + np_
+            ids = np.arange(1, r * per_term + 1, dtype=np.int32).reshape(r, per_term)
+            self.alpha = ids[:, :nm].reshape(r, n, m)
+            self.beta = ids[:, nm:nm + mp].reshape(r, m, p)
+            self.gamma = ids[:, nm + mp:].reshape(r, n, p)
+            self.num_primary = r * per_term
+
+        # Every equation owns a fixed block of auxiliary variables: r for the
+        # rank one products and r - 1 for the running parity of the XOR chain.
+        # Fixing the blocks up front keeps the numbering independent of the
+        # order and chunking the equations are encoded in.
+        self.aux_per_equation = 2 * r - 1
+        self.clauses_per_equation = 8 * r - 3
+        self.num_vars = self.num_primary + len(self.equations) * self.aux_per_equation
+
+    def _cyclic_ansatz(self, fixed: int):
+        # Schemes invariant under (alpha, beta, gamma) -> (beta, gamma^T, alpha^T),
+        # which maps schemes to schemes as tr(X Y Z^T) = tr(Y Z^T X). Each of the
+        # first `fixed` terms is (x, x, x^T), the rest come in orbits (a, b, c),
+        # (b, c^T, a^T), (c^T, a, b^T) and only the orbit representatives get
+        # variables, so factors share ids. The scheme tensor is invariant too,
+        # so only one Brent equation per orbit of (a, b, c) -> (c^T, a, b^T) is
+        # needed.
+        n, r = self.n, self.r
+        if not self.n == self.m == self.p:
+            raise ValueError('The cyclic ansatz needs n = m = p')
+        if not 0 <= fixed <= r or (r - fixed) % 3:
+            raise ValueError(f'Rank {r} is not {fixed} fixed terms plus whole orbits')
+        size = n * n
+        orbits = (r - fixed) // 3
+        # transpose[x] is the flat index of the transposed entry of x
+        transpose = np.arange(size).reshape(n, n).T.reshape(-1)
+        ids = np.arange(1, (fixed + 3 * orbits) * size + 1, dtype=np.int32)
+        x = ids[:fixed * size].reshape(fixed, size)
+        a, b, c = ids[fixed * size:].reshape(orbits, 3, size).transpose(1, 0, 2)
+        alpha = np.concatenate([x, np.stack([a, b, c[:, transpose]], axis=1).reshape(-1, size)])
+        beta = np.concatenate([x, np.stack([b, c[:, transpose], a], axis=1).reshape(-1, size)])
+        gamma = np.concatenate([x[:, transpose], np.stack([c, a[:, transpose], b[:, transpose]], axis=1).reshape(-1, size)])
+        self.alpha, self.beta, self.gamma = [factor.reshape(r, n, n) for factor in (alpha, beta, gamma)]
+        self.num_primary = len(ids)
+
+        e = self.equations
+        image = lambda e: np.ravel_multi_index(
+            (transpose[e % size], e // (size * size), transpose[e // size % size]), (size, size, size))
+        self.equations = e[(e <= image(e)) & (e <= image(image(e)))]
+        # Fixed terms and orbits can be permuted among themselves
+        self.symmetric_terms = [list(range(fixed)), list(range(fixed, r, 3))]
+
+    def new_vars(self, count: int) -> np.ndarray:
+        ids = np.arange(self.num_vars + 1, self.num_vars + count + 1, dtype=np.int32)
+        self.num_vars += count
+        return ids
+
+    def variable_names(self, symbols='abc', offset=0) -> dict:
+        # Variables shared between factors (cyclic ansatz) keep the name of
+        # their first occurrence
+        names = {}
+        for symbol, factor in zip(symbols, (self.alpha, self.beta, self.gamma)):
+            for (l, i, j), var in np.ndenumerate(factor):
+                names.setdefault(int(var), f'{symbol}{i + offset}{j + offset}^{l + offset}')
+        return names
+
+    def equation_clauses(self, positions) -> np.ndarray:
+        # Clauses of the equations at the given positions of self.equations,
+        # grouped per equation in the given order
+        positions = np.atleast_1d(np.asarray(positions, dtype=np.int64))
+        r = self.r
+        eq = self.equations[positions]
+        a_idx, b_idx, c_idx = np.unravel_index(eq, (self.n * self.m, self.m * self.p, self.n * self.p))
+        a = self.alpha.reshape(r, -1)[:, a_idx].T
+        b = self.beta.reshape(r, -1)[:, b_idx].T
+        c = self.gamma.reshape(r, -1)[:, c_idx].T
+
+        base = self.num_primary + positions * self.aux_per_equation + 1
+        t = (base[:, None] + np.arange(r)).astype(np.int32)
+        s = (base[:, None] + r + np.arange(r - 1)).astype(np.int32)
+        zero = np.zeros_like(t)
+
+        # t <-> a & b & c
+        blocks = [
+            np.stack([-t, a, zero, zero], axis=-1),
+            np.stack([-t, b, zero, zero], axis=-1),
+            np.stack([-t, c, zero, zero], axis=-1),
+            np.stack([t, -a, -b, -c], axis=-1),
+        ]
+
+        # s_k <-> s_(k-1) ^ t_k, where s_0 is t_0
+        if r > 1:
+            prev = np.concatenate([t[:, :1], s[:, :-1]], axis=1)
+            cur = t[:, 1:]
+            zero = np.zeros_like(s)
+            blocks += [
+                np.stack([-s, prev, cur, zero], axis=-1),
+                np.stack([-s, -prev, -cur, zero], axis=-1),
+                np.stack([s, -prev, cur, zero], axis=-1),
+                np.stack([s, prev, -cur, zero], axis=-1),
+            ]
+            parity = s[:, -1]
+        else:
+            parity = t[:, 0]
+
+        # The parity of the chain is the right hand side
+        unit = np.where(self.rhs[eq] == 1, parity, -parity)
+        blocks.append(np.stack([unit] + [np.zeros_like(unit)] * 3, axis=-1)[:, None, :])
+
+        return np.concatenate(blocks, axis=1).reshape(-1, CLAUSE_WIDTH)
+
+    def term_variables(self, l: int) -> np.ndarray:
+        # Every primary variable of term l
+        return np.concatenate([factor[l].reshape(-1) for factor in (self.alpha, self.beta, self.gamma)])
+
+    def decode(self, assignment) -> MM_Scheme:
+        # Coefficients from a bool assignment indexed by variable id
+        assignment = np.asarray(assignment, dtype=bool)
+        return MM_Scheme(*[assignment[ids].astype(np.int8) for ids in (self.alpha, self.beta, self.gamma)])
+
+    def coefficient_values(self, var: int, coefficient: int) -> list:
+        # (variable, value) pairs encoding one coefficient
+        return [(var, coefficient % 2 != 0)]
+
+    def term_assignment(self, l: int, U, V, W) -> dict:
+        # Variable values that make term l the term with factor matrices U, V, W
+        assignment = {}
+        for ids, X in zip((self.alpha, self.beta, self.gamma), (U, V, W)):
+            for var, x in zip(ids[l].reshape(-1).tolist(), np.asarray(X).reshape(-1).tolist()):
+                for var_, value in self.coefficient_values(var, x):
+                    assignment.setdefault(var_, value)
+        return assignment
+
+    def scheme_assignment(self, scheme: MM_Scheme) -> dict:
+        # Variable values that put the terms of a scheme into the term slots.
+        # Its nonzero terms go last in lex order after zero terms filling the
+        # slots left over, terms beyond rank r are dropped. Under the cyclic
+        # ansatz the terms are taken in order, so the scheme has to follow
+        # the orbit layout.
+        if scheme.dimension != (self.n, self.m, self.p):
+            raise ValueError(f'Scheme for {scheme.dimension}, not {(self.n, self.m, self.p)}')
+        if self.cyclic is not None:
+            terms = list(zip(scheme.U, scheme.V, scheme.W))[:self.r]
+        else:
+            scheme = scheme.drop_zero_terms()
+            def key(term):
+                values = self.term_assignment(0, *term)
+                return ([values[var] for var in self.term_vector(0)]
+                        + [values[var] for var in self.term_vector(0, include_gamma=True)])
+            terms = sorted(zip(scheme.U, scheme.V, scheme.W), key=key)[:self.r]
+            if terms:
+                zero = tuple(np.zeros_like(X) for X in terms[0])
+                terms = [zero] * (self.r - len(terms)) + terms
+        assignment = {}
+        for l, term in enumerate(terms):
+            for var, value in self.term_assignment(l, *term).items():
+                assignment.setdefault(var, value)
+        return assignment
+
+    def coefficient_assignment(self, coefficients: dict) -> dict:
+        # Variable values for a partial assignment of coefficients by name,
+        # {'a01^3': 1, ...} with the names exists_scheme gives them
+        slots = {}
+        for symbol, factor in zip('abc', (self.alpha, self.beta, self.gamma)):
+            for (l, i, j), var in np.ndenumerate(factor):
+                slots[f'{symbol}{i}{j}^{l}'] = int(var)
+        assignment = {}
+        for name, coefficient in coefficients.items():
+            if name not in slots:
+                raise ValueError(f'Invalid coefficient name: {name}')
+            for var, value in self.coefficient_values(slots[name], coefficient):
+                assignment.setdefault(var, value)
+        return assignment
+
+    def term_vector(self, l: int, include_gamma=False) -> np.ndarray:
+        factors = (self.alpha, self.beta, self.gamma) if include_gamma else (self.alpha, self.beta)
+        return np.concatenate([factor[l].reshape(-1) for factor in factors])
+
+    def lex_clauses(self, include_gamma=False) -> np.ndarray:
+        # Order the terms lexicographically, term l <= term l + 1 within every
+        # group of symmetric terms, on their alpha and beta entries and
+        # optionally the gamma entries as well
+        clauses = []
+        for terms in self.symmetric_terms:
+            for l, l_next in zip(terms, terms[1:]):
+                x = self.term_vector(l, include_gamma)
+                y = self.term_vector(l_next, include_gamma)
+                clauses.append(lex_leq_clauses(x, y, self.new_vars(len(x) - 1)))
+        return stack_clauses(clauses)
+
+    def clauses(self, chunk_size=64):
+        # Yield the Brent clauses chunk by chunk so callers never need the
+        # whole formula in memory at once
+        for start in range(0, len(self.equations), chunk_size):
+            yield self.equation_clauses(np.arange(start, min(start + chunk_size, len(self.equations))))
+
+def brent_clauses(n: int, m: int, p: int, r: int) -> np.ndarray:
+    encoder = BrentEncoder(n, m, p, r)
+    return np.concatenate(list(encoder.clauses()))
+
+def stack_clauses(arrays) -> np.ndarray:
+    # Concatenate clause arrays of different widths, padding the narrow ones
+    arrays = [np.asarray(clauses, dtype=np.int32) for clauses in arrays]
+    width = max([CLAUSE_WIDTH] + [clauses.shape[1] for clauses in arrays])
+    return np.concatenate([np.pad(clauses, ((0, 0), (0, width - clauses.shape[1]))) for clauses in arrays]
+                          + [np.zeros((0, width), dtype=np.int32)])
+
+def compact(clauses: np.ndarray) -> np.ndarray:
+    # Move the padding of every row to the end
+    order = np.argsort(clauses == 0, axis=1, kind='stable')
+    return np.take_along_axis(clauses, order, axis=1)
+
+def lex_leq_clauses(x, y, equal) -> np.ndarray:
+    # x <=_lex y (False < True), equal[i] is an auxiliary variable that is
+    # forced true when x and y agree on the first i + 1 entries, giving 3L - 2
+    # clauses and L - 1 auxiliaries for vectors of length L
+    x, y, equal = [np.asarray(v, dtype=np.int32) for v in (x, y, equal)]
+    # Agreement before position i, nothing (0) before the first entry
+    before = np.concatenate([[0], equal]).astype(np.int32)
+    zero = np.zeros_like(x)
+    # Equal so far implies x_i <= y_i ...
+    leq = np.stack([-before, -x, y, zero], axis=-1)
+    # ... and then x_i == y_i means not (-x_i & y_i), which keeps them equal
+    keep_x = np.stack([-before[:-1], -x[:-1], equal, zero[:-1]], axis=-1)
+    keep_y = np.stack([-before[:-1], y[:-1], equal, zero[:-1]], axis=-1)
+    return compact(np.concatenate([leq, keep_x, keep_y]))
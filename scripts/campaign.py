@@ -0,0 +1,231 @@
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import sqlite3
+import sys
+import time
+from instance_cache import InstanceCache
+from instrument import Recorder
+from z3_solve import build_solver, solver_statistics
+
+# Headless sweeps over (n, m, p, r) grids. A grid spec is a JSON file like
+#
+#   {"dims": [[2, 2, 2], [2, 2, 3]],
+#    "ranks": {"222": [6, 7], "223": [10, 11]},
+#    "modes": ["sat", "ternary-sat"],
+#    "options": {"lex": [true, false], "valid_ineq": [false]},
+#    "timeout": 600}
+#
+# where "ranks" is either one list for all dims or a list per "nmp" key and
+# every combination of the "options" values becomes a separate job. Jobs and
+# their results live in a SQLite store, so a campaign that crashed or was
+# interrupted picks up where it left off when it is started again.
+
+DEFAULT_COEFFICIENTS = {'sat': [0, 1], 'ternary-sat': [-1, 0, 1], 'smt': [-1, 0, 1]}
+OPTIONS = ('lex', 'lex_gamma', 'sign_sym', 'valid_ineq', 'cardinality', 'coefficients', 'seed', 'cyclic')
+# Jobs with these statuses are not run again when a campaign resumes. A job
+# is 'unknown' when z3 gave up for another reason than its timeout (memory,
+# cancellation, ...), the jobs table keeps z3's reason.
+FINISHED = ('done', 'timeout', 'unknown', 'error')
+# A job's timeout is its wall clock budget, encoding included. z3 gets what
+# is left of it for the check, and a worker still running this long after
+# the budget (stuck encoding, runaway memory, ...) is killed.
+KILL_GRACE = 10.0
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    n INTEGER, m INTEGER, p INTEGER, r INTEGER,
+    mode TEXT,
+    options TEXT,
+    timeout REAL,
+    status TEXT DEFAULT 'pending',
+    result TEXT,
+    encode_seconds REAL,
+    solve_seconds REAL,
+    assertions INTEGER,
+    stats TEXT,
+    error TEXT,
+    finished REAL,
+    reason TEXT,
+    clauses INTEGER
+)
+'''
+
+def job_id(job) -> str:
+    key = json.dumps({name: job[name] for name in ('n', 'm', 'p', 'r', 'mode', 'options')}, sort_keys=True)
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+def expand_grid(spec) -> list:
+    names = sorted(spec.get('options', {}))
+    values = [spec['options'][name] for name in names]
+    for name in names:
+        if name not in OPTIONS:
+            raise ValueError(f'Invalid option: {name}')
+    jobs = []
+    for n, m, p in spec['dims']:
+        ranks = spec['ranks']
+        if isinstance(ranks, dict):
+            ranks = ranks[f'{n}{m}{p}']
+        for r in ranks:
+            for mode in spec['modes']:
+                for combination in itertools.product(*values):
+                    job = {'n': n, 'm': m, 'p': p, 'r': r, 'mode': mode, 'options': dict(zip(names, combination)),
+                           'timeout': spec.get('timeout')}
+                    job['id'] = job_id(job)
+                    jobs.append(job)
+    return jobs
+
+def run_job(job) -> dict:
+    # Runs in a worker process, never prompts: unset options are off. Jobs
+    # on the same instance share its encoding through the instance cache.
+    options = job['options']
+    mode = job['mode']
+    record = {'id': job['id']}
+    recorder = Recorder()
+    try:
+        t0 = time.time()
+        solver = build_solver(job['n'], job['m'], job['p'], job['r'], mode,
+                              options.get('coefficients', DEFAULT_COEFFICIENTS.get(mode)),
+                              options.get('lex', False), options.get('lex_gamma', False),
+                              options.get('sign_sym', False), options.get('valid_ineq', False),
+                              options.get('cardinality', 'totalizer'), cyclic=options.get('cyclic'),
+                              recorder=recorder, cache=InstanceCache())
+        if 'seed' in options:
+            solver.set(random_seed=options['seed'])
+        t1 = time.time()
+        if job['timeout']:
+            solver.set(timeout=max(1, int((job['timeout'] - (t1 - t0)) * 1000)))
+        result = str(solver.check())
+        if result in ('sat', 'unsat'):
+            status = 'done'
+        else:
+            record['reason'] = solver.reason_unknown()
+            status = 'timeout' if record['reason'] == 'timeout' else 'unknown'
+        # CNF is posted a chunk per assertion, so the sat modes count clauses
+        # and only smt counts assertions
+        record.update(status=status, result=result,
+                      encode_seconds=t1 - t0, solve_seconds=time.time() - t1,
+                      clauses=recorder.total('clauses') if mode != 'smt' else None,
+                      assertions=len(solver.assertions()) if mode == 'smt' else None,
+                      stats=json.dumps(solver_statistics(solver)))
+    except Exception as error:
+        record.update(status='error', error=repr(error))
+    record['finished'] = time.time()
+    return record
+
+def open_store(path: str) -> sqlite3.Connection:
+    connection = sqlite3.connect(path)
+    connection.row_factory = sqlite3.Row
+    connection.execute(SCHEMA)
+    # Stores from before z3's reason and the clause counts were kept
+    columns = [row[1] for row in connection.execute('PRAGMA table_info(jobs)')]
+    for name, kind in (('reason', 'TEXT'), ('clauses', 'INTEGER')):
+        if name not in columns:
+            connection.execute(f'ALTER TABLE jobs ADD COLUMN {name} {kind}')
+    return connection
+
+def add_jobs(connection, jobs) -> None:
+    connection.executemany(
+        'INSERT OR IGNORE INTO jobs (id, n, m, p, r, mode, options, timeout) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+        [(job['id'], job['n'], job['m'], job['p'], job['r'], job['mode'], json.dumps(job['options'], sort_keys=True),
+          job['timeout']) for job in jobs])
+    connection.commit()
+
+def pending_jobs(connection) -> list:
+    # Jobs still pending or left running by a crashed campaign
+    rows = connection.execute(f'SELECT * FROM jobs WHERE status NOT IN ({", ".join("?" * len(FINISHED))})',
+                              FINISHED).fetchall()
+    return [{'id': row['id'], 'n': row['n'], 'm': row['m'], 'p': row['p'], 'r': row['r'], 'mode': row['mode'],
+             'options': json.loads(row['options']), 'timeout': row['timeout']} for row in rows]
+
+def save_record(connection, record) -> None:
+    columns = [name for name in record if name != 'id']
+    connection.execute(f'UPDATE jobs SET {", ".join(f"{name} = ?" for name in columns)} WHERE id = ?',
+                       [record[name] for name in columns] + [record['id']])
+    connection.commit()
+
+def _worker(job, results):
+    results.put(run_job(job))
+
+def run_campaign(spec, store='campaign.db', workers=None):
+    connection = open_store(store)
+    add_jobs(connection, expand_grid(spec))
+    jobs = pending_jobs(connection)
+    connection.executemany('UPDATE jobs SET status = ? WHERE id = ?', [('running', job['id']) for job in jobs])
+    connection.commit()
+    print(f'{len(jobs)} jobs to run')
+    def finish(record):
+        save_record(connection, record)
+        print(f'{record["id"]}: {record["status"]} {record.get("result", record.get("error", ""))}')
+    # A fresh process per job, so z3 memory is given back between instances
+    # and a job past its deadline can be killed on its own
+    workers = workers or os.cpu_count()
+    results = multiprocessing.Queue()
+    waiting = list(jobs)
+    running = {}
+    while waiting or running:
+        while waiting and len(running) < workers:
+            job = waiting.pop(0)
+            process = multiprocessing.Process(target=_worker, args=(job, results))
+            process.start()
+            deadline = time.time() + job['timeout'] + KILL_GRACE if job['timeout'] else None
+            running[job['id']] = (process, deadline)
+        try:
+            record = results.get(timeout=1.0)
+        except queue.Empty:
+            record = None
+        # A job killed at its deadline may still have sent its record
+        if record is not None and record['id'] in running:
+            process, _ = running.pop(record['id'])
+            process.join()
+            finish(record)
+        # Deadlines are checked on every pass, records of other jobs coming
+        # in must not keep a hung worker alive
+        now = time.time()
+        for id_, (process, deadline) in list(running.items()):
+            if deadline is not None and now > deadline:
+                process.kill()
+                process.join()
+                del running[id_]
+                finish({'id': id_, 'status': 'timeout', 'result': 'unknown',
+                        'error': 'killed after its wall clock limit', 'finished': now})
+            elif not process.is_alive() and process.exitcode != 0:
+                # Died without a record, e.g. killed by the OOM killer
+                del running[id_]
+                finish({'id': id_, 'status': 'error', 'error': f'worker exited with code {process.exitcode}',
+                        'finished': now})
+    connection.close()
+
+def export_jsonl(store: str, filename: str) -> None:
+    connection = open_store(store)
+    with open(filename, 'w') as file:
+        for row in connection.execute('SELECT * FROM jobs ORDER BY n, m, p, r, mode, options'):
+            record = dict(row)
+            for name in ('options', 'stats'):
+                if record[name] is not None:
+                    record[name] = json.loads(record[name])
+            file.write(json.dumps(record) + '\n')
+    connection.close()
+
+def main():
+    flags = dict(arg[2:].split('=', 1) for arg in sys.argv[1:] if arg.startswith('--') and '=' in arg)
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    store = flags.get('store', 'campaign.db')
+    if 'export' in flags:
+        export_jsonl(store, flags['export'])
+        return
+    if len(args) < 1:
+        print(f'Usage : \'python3 {sys.argv[0]} grid.json [--store=campaign.db] [--workers=<count>]\'\n'
+              f'        \'python3 {sys.argv[0]} --export=results.jsonl [--store=campaign.db]\'')
+        sys.exit(1)
+    with open(args[0]) as file:
+        spec = json.load(file)
+    workers = int(flags['workers']) if 'workers' in flags else os.cpu_count()
+    run_campaign(spec, store, workers)
+
+if __name__ == "__main__":
+    main()
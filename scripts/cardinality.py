@@ -0,0 +1,251 @@
+import numpy as np
+from brent_cnf import CLAUSE_WIDTH, stack_clauses
+
+# Cardinality constraints over integer literals as zero padded clause arrays.
+# Every encoding takes the literals, the bound and new_vars(count), an
+# allocator returning fresh variable ids (e.g. BrentEncoder.new_vars).
+
+def clause_array(rows) -> np.ndarray:
+    width = max([CLAUSE_WIDTH] + [len(row) for row in rows])
+    clauses = np.zeros((len(rows), width), dtype=np.int32)
+    for idx, row in enumerate(rows):
+        clauses[idx, :len(row)] = row
+    return clauses
+
+def sequential_counter(lits, k, new_vars) -> list:
+    # Sinz' sequential counter for at most k: s[i][j] holds when at least
+    # j + 1 of the first i + 1 literals are true
+    lits = [int(x) for x in lits]
+    n = len(lits)
+    if k >= n:
+        return []
+    if k == 0:
+        return [[-x] for x in lits]
+    s = new_vars((n - 1) * k).reshape(n - 1, k).tolist()
+    rows = [[-lits[0], s[0][0]]]
+    rows += [[-s[0][j]] for j in range(1, k)]
+    for i in range(1, n - 1):
+        x = lits[i]
+        rows += [[-x, s[i][0]], [-s[i - 1][0], s[i][0]]]
+        for j in range(1, k):
+            rows += [[-x, -s[i - 1][j - 1], s[i][j]], [-s[i - 1][j], s[i][j]]]
+        rows.append([-x, -s[i - 1][k - 1]])
+    rows.append([-lits[-1], -s[n - 2][k - 1]])
+    return rows
+
+def _unary_sum(left, right, limit, new_vars, rows, exact=False):
+    # Unary count of two unary counts together, truncated to limit outputs:
+    # outputs[j] holds when at least j + 1 inputs do, and with exact only then
+    outputs = new_vars(min(len(left) + len(right), limit)).tolist()
+    for i in range(len(left) + 1):
+        for j in range(len(right) + 1):
+            if i + j > 0:
+                out = outputs[min(i + j, len(outputs)) - 1]
+                rows.append([-left[i - 1]] * (i > 0) + [-right[j - 1]] * (j > 0) + [out])
+            if exact and i + j < len(outputs):
+                rows.append(left[i:i + 1] + right[j:j + 1] + [-outputs[i + j]])
+    return outputs
+
+def _totalizer_tree(lits, limit, new_vars, rows, exact=False):
+    # Unary count of the true literals, outputs[j] holds when at least
+    # j + 1 are true, truncated to limit outputs
+    if len(lits) == 1:
+        return lits
+    half = len(lits) // 2
+    left = _totalizer_tree(lits[:half], limit, new_vars, rows, exact)
+    right = _totalizer_tree(lits[half:], limit, new_vars, rows, exact)
+    return _unary_sum(left, right, limit, new_vars, rows, exact)
+
+def totalizer(lits, k, new_vars) -> list:
+    # Bailleux and Boufkhad's totalizer for at most k, counting up to k + 1
+    lits = [int(x) for x in lits]
+    if k >= len(lits):
+        return []
+    if k == 0:
+        return [[-x] for x in lits]
+    rows = []
+    outputs = _totalizer_tree(lits, k + 1, new_vars, rows)
+    rows.append([-outputs[k]])
+    return rows
+
+def _comparator(a, b, new_vars, rows, exact=False):
+    # Half comparator (only the upward implications at most k needs), exact
+    # adds the downward ones
+    high, low = new_vars(2).tolist()
+    rows += [[-a, high], [-b, high], [-a, -b, low]]
+    if exact:
+        rows += [[a, b, -high], [a, -low], [b, -low]]
+    return high, low
+
+def _odd_even_merge(lits, new_vars, rows, exact=False):
+    # Batcher's merge of two sorted halves, len(lits) a power of two
+    if len(lits) == 2:
+        return list(_comparator(lits[0], lits[1], new_vars, rows, exact))
+    even = _odd_even_merge(lits[0::2], new_vars, rows, exact)
+    odd = _odd_even_merge(lits[1::2], new_vars, rows, exact)
+    merged = [even[0]]
+    for i in range(len(odd) - 1):
+        merged += _comparator(odd[i], even[i + 1], new_vars, rows, exact)
+    merged.append(odd[-1])
+    return merged
+
+def _odd_even_sort(lits, new_vars, rows, exact=False):
+    if len(lits) == 1:
+        return lits
+    half = len(lits) // 2
+    return _odd_even_merge(_odd_even_sort(lits[:half], new_vars, rows, exact)
+                           + _odd_even_sort(lits[half:], new_vars, rows, exact), new_vars, rows, exact)
+
+def _padded(lits, new_vars, rows):
+    # lits padded to a power of two with a single literal fixed to false
+    size = 1 << (len(lits) - 1).bit_length()
+    if size > len(lits):
+        false = int(new_vars(1)[0])
+        rows.append([-false])
+        lits = lits + [false] * (size - len(lits))
+    return lits
+
+def sorting_network(lits, k, new_vars) -> list:
+    # Odd-even merge sorting network for at most k, the input is padded to a
+    # power of two with a single literal fixed to false
+    lits = [int(x) for x in lits]
+    if k >= len(lits):
+        return []
+    if k == 0:
+        return [[-x] for x in lits]
+    rows = []
+    outputs = _odd_even_sort(_padded(lits, new_vars, rows), new_vars, rows)
+    rows.append([-outputs[k]])
+    return rows
+
+ENCODINGS = {
+    'sequential': sequential_counter,
+    'totalizer': totalizer,
+    'sorting_network': sorting_network,
+}
+
+def at_most_k(lits, k, new_vars, encoding='totalizer') -> np.ndarray:
+    if encoding == 'cheapest':
+        encoding = cheapest_encoding(len(lits), k, 'at_most')
+    if encoding not in ENCODINGS:
+        raise ValueError(f'Invalid encoding: {encoding}')
+    return clause_array(ENCODINGS[encoding](lits, k, new_vars))
+
+def at_least_k(lits, k, new_vars, encoding='totalizer') -> np.ndarray:
+    # At least k true is at most len - k false
+    if k <= 0:
+        return clause_array([])
+    if k > len(lits):
+        raise ValueError(f'At least {k} of {len(lits)} literals is unsatisfiable')
+    if encoding == 'cheapest':
+        encoding = cheapest_encoding(len(lits), k, 'at_least')
+    return at_most_k([-int(x) for x in lits], len(lits) - k, new_vars, encoding)
+
+def exactly_k(lits, k, new_vars, encoding='totalizer') -> np.ndarray:
+    # A single counting network with implications both ways, so its outputs
+    # are the count and can be fixed at k. The sequential counter is the
+    # totalizer grown one literal at a time.
+    lits = [int(x) for x in lits]
+    if not 0 <= k <= len(lits):
+        raise ValueError(f'Exactly {k} of {len(lits)} literals is unsatisfiable')
+    if k == 0:
+        return clause_array([[-x] for x in lits])
+    if k == len(lits):
+        return clause_array([[x] for x in lits])
+    if encoding == 'cheapest':
+        encoding = cheapest_encoding(len(lits), k, 'exactly')
+    if encoding not in ENCODINGS:
+        raise ValueError(f'Invalid encoding: {encoding}')
+    rows = []
+    if encoding == 'sequential':
+        outputs = lits[:1]
+        for x in lits[1:]:
+            outputs = _unary_sum(outputs, [x], k + 1, new_vars, rows, exact=True)
+    elif encoding == 'totalizer':
+        outputs = _totalizer_tree(lits, k + 1, new_vars, rows, exact=True)
+    else:
+        outputs = _odd_even_sort(_padded(lits, new_vars, rows), new_vars, rows, exact=True)
+    rows += [[outputs[k - 1]], [-outputs[k]]]
+    return clause_array(rows)
+
+def encoding_cost(encoding, n, k, bound='at_most'):
+    # Clauses and auxiliary variables an encoding needs for n literals
+    counter = [0]
+    def new_vars(count):
+        counter[0] += count
+        return np.arange(n + counter[0] - count + 1, n + counter[0] + 1)
+    constraint = {'at_most': at_most_k, 'at_least': at_least_k, 'exactly': exactly_k}[bound]
+    clauses = constraint(np.arange(1, n + 1), k, new_vars, encoding)
+    return {'encoding': encoding, 'clauses': len(clauses), 'aux_vars': counter[0]}
+
+def cheapest_encoding(n, k, bound='at_most') -> str:
+    costs = [encoding_cost(encoding, n, k, bound) for encoding in ENCODINGS]
+    return min(costs, key=lambda cost: (cost['clauses'] + cost['aux_vars'], cost['clauses']))['encoding']
+
+# The valid inequalities that are cardinality constraints, by their number
+CARDINALITY_FAMILIES = (9, 10)
+
+def family_encodings(encoding='totalizer') -> dict:
+    # Encoding of every cardinality family, from one encoding for all of them
+    # or a dict {family: encoding} where families left out get the totalizer.
+    # Families may be given as strings, as they come out of JSON.
+    if isinstance(encoding, str):
+        encodings = dict.fromkeys(CARDINALITY_FAMILIES, encoding)
+    else:
+        encodings = dict.fromkeys(CARDINALITY_FAMILIES, 'totalizer')
+        for family, name in encoding.items():
+            if int(family) not in CARDINALITY_FAMILIES:
+                raise ValueError(f'Invalid cardinality family: {family}')
+            encodings[int(family)] = name
+    for name in encodings.values():
+        if name != 'cheapest' and name not in ENCODINGS:
+            raise ValueError(f'Invalid encoding: {name}')
+    return encodings
+
+def valid_inequality_clauses(encoder, encoding='totalizer', gamma_signs=None) -> np.ndarray:
+    # The valid inequalities of add_valid_inequalities for the F_2 encoding,
+    # numbered the same way. encoding is one encoding for the cardinality
+    # families 9 and 10 or a dict per family (see family_encodings), and
+    # 'cheapest' picks one per constraint. For the ternary encoding the
+    # factors are the nonzero variables and gamma_signs the negative ones,
+    # which only matter for 10.
+    encodings = family_encodings(encoding)
+    n, m, p, r = encoder.n, encoder.m, encoder.p, encoder.r
+    alpha = encoder.alpha.reshape(r, -1)
+    beta = encoder.beta.reshape(r, -1)
+    gamma = encoder.gamma.reshape(r, -1)
+    rows = []
+    clauses = []
+    # 8: every term has a nonzero gamma
+    rows += gamma.tolist()
+    # 9: C[i][k] is a bilinear form of rank m, so at least m terms use it
+    for entry in range(n * p):
+        clauses.append(at_least_k(gamma[:, entry], m, encoder.new_vars, encodings[9]))
+    # 10: C[i][k] - C[i'][k'] has rank m (shared row or column) or 2m, so the
+    # two gamma columns differ in at least that many terms
+    for a in range(n * p):
+        for b in range(a + 1, n * p):
+            (i1, k1), (i2, k2) = divmod(a, p), divmod(b, p)
+            bound = m if i1 == i2 or k1 == k2 else 2 * m
+            differ = encoder.new_vars(r)
+            for l, (d, x, y) in enumerate(zip(differ.tolist(), gamma[:, a].tolist(), gamma[:, b].tolist())):
+                if gamma_signs is None:
+                    rows += [[-d, x, y], [-d, -x, -y]]
+                else:
+                    sx, sy = int(gamma_signs[l].flat[a]), int(gamma_signs[l].flat[b])
+                    for z in (1, -1):
+                        for s in (1, -1):
+                            rows.append([-d, z * x, z * y, s * sx, s * sy])
+            clauses.append(at_least_k(differ, bound, encoder.new_vars, encodings[10]))
+    # 11, 12: every alpha and beta entry is used by some term
+    rows += alpha.T.tolist()
+    rows += beta.T.tolist()
+    # 13: every product A[i][k] B[k][j] appears in some term
+    for i in range(n):
+        for j in range(p):
+            for k in range(m):
+                both = encoder.new_vars(r).tolist()
+                for t, x, y in zip(both, alpha[:, i * m + k].tolist(), beta[:, k * p + j].tolist()):
+                    rows += [[-t, x], [-t, y]]
+                rows.append(both)
+    return stack_clauses([clause_array(rows)] + clauses)
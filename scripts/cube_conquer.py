@@ -0,0 +1,210 @@
+import hashlib
+import itertools
+import multiprocessing
+import os
+import sqlite3
+import sys
+import time
+import numpy as np
+from z3 import Solver, is_true
+from dimacs import decode_scheme, load_sign_map, load_variable_map, variable_map_path
+from instance_cache import InstanceCache, instance_key
+
+# Cube and conquer on cached DIMACS instances. Cubes fix the first alpha and
+# beta entries of the first terms, where the lex order leaves the fewest
+# choices. Under lex a cube whose term prefixes are not ordered can have no
+# solution, so those cubes are never generated. Each cube is solved by its
+# own z3 call in a process pool with its literals appended as unit clauses,
+# which keeps z3 on its non-incremental SAT path. Results go to a SQLite
+# store as they come in, with the model of a sat cube, so an interrupted run
+# resumes with the cubes it has not settled and a finished one still has
+# its scheme. The run stops at the first sat cube.
+
+# Cubes with these results are not solved again when a run resumes. Cubes
+# that timed out ('unknown') are, so a rerun with a longer timeout can
+# still settle them.
+FINISHED = ('sat', 'unsat')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS cubes (
+    run TEXT,
+    idx INTEGER,
+    literals TEXT,
+    result TEXT,
+    seconds REAL,
+    finished REAL,
+    model TEXT,
+    PRIMARY KEY (run, idx)
+)
+'''
+
+def split_variables(alpha, beta, terms: int, width: int) -> np.ndarray:
+    # (terms, width) DIMACS ids, the first alpha then beta entries of each term
+    r = len(alpha)
+    entries = np.concatenate([alpha.reshape(r, -1), beta.reshape(r, -1)], axis=1)
+    if terms > r or width > entries.shape[1]:
+        raise ValueError(f'Cannot split on {width} entries of {terms} terms')
+    return entries[:terms, :width]
+
+def generate_cubes(variables, lex=True) -> list:
+    # Every sign pattern of the split variables as lists of DIMACS literals,
+    # with lex only those whose term prefixes are in (non-strict) lex order
+    terms, width = variables.shape
+    cubes = []
+    for bits in itertools.product((False, True), repeat=terms * width):
+        prefixes = [bits[t * width:(t + 1) * width] for t in range(terms)]
+        if lex and any(a > b for a, b in zip(prefixes, prefixes[1:])):
+            continue
+        cubes.append([var if bit else -var for var, bit in zip(variables.reshape(-1).tolist(), bits)])
+    return cubes
+
+def run_id(key: str, terms: int, width: int) -> str:
+    return hashlib.sha1(f'{key} {terms} {width}'.encode()).hexdigest()[:16]
+
+def open_store(path: str) -> sqlite3.Connection:
+    connection = sqlite3.connect(path)
+    connection.execute(SCHEMA)
+    # Stores from before models were kept
+    if 'model' not in [row[1] for row in connection.execute('PRAGMA table_info(cubes)')]:
+        connection.execute('ALTER TABLE cubes ADD COLUMN model TEXT')
+    return connection
+
+def add_cubes(connection, run, cubes) -> None:
+    connection.executemany('INSERT OR IGNORE INTO cubes (run, idx, literals) VALUES (?, ?, ?)',
+                           [(run, idx, ' '.join(map(str, cube))) for idx, cube in enumerate(cubes)])
+    connection.commit()
+
+def pending_cubes(connection, run) -> list:
+    rows = connection.execute(f'SELECT idx, literals FROM cubes WHERE run = ? AND (result IS NULL OR result NOT IN '
+                              f'({", ".join("?" * len(FINISHED))})) ORDER BY idx', (run, *FINISHED)).fetchall()
+    return [(idx, [int(x) for x in literals.split()]) for idx, literals in rows]
+
+def sat_model(connection, run):
+    # True variables of the model of a sat cube of the run, None if there is none
+    row = connection.execute("SELECT model FROM cubes WHERE run = ? AND result = 'sat' AND model IS NOT NULL",
+                             (run,)).fetchone()
+    return None if row is None else [int(x) for x in row[0].split()]
+
+def decode_model(path, true_vars):
+    # Scheme from the true variables of a model of the instance at path
+    alpha, beta, gamma = load_variable_map(variable_map_path(path))
+    signs = load_sign_map(variable_map_path(path))
+    ids = (alpha, beta, gamma) + (signs or ())
+    assignment = np.zeros(max(max(int(x.max()) for x in ids), max(true_vars, default=0)) + 1, dtype=bool)
+    assignment[true_vars] = True
+    return decode_scheme(assignment, alpha, beta, gamma, signs)
+
+def cube_counts(connection, run) -> dict:
+    rows = connection.execute('SELECT result, COUNT(*), SUM(seconds) FROM cubes WHERE run = ? GROUP BY result',
+                              (run,)).fetchall()
+    return {result: (count, seconds or 0.0) for result, count, seconds in rows}
+
+# Per worker state, the instance text is read once per process. z3 only
+# recognizes a DIMACS string that starts with the header, so comments go.
+_dimacs = None
+_timeout = None
+
+def _load(path, timeout):
+    global _dimacs, _timeout
+    with open(path) as file:
+        _dimacs = ''.join(line for line in file if not line.startswith('c'))
+    _timeout = timeout
+
+def solve_cube(task):
+    # (idx, result, seconds, true variables of the model or None)
+    idx, cube = task
+    solver = Solver()
+    if _timeout:
+        solver.set(timeout=int(_timeout * 1000))
+    solver.from_string(_dimacs + ''.join(f'{lit} 0\n' for lit in cube))
+    t0 = time.time()
+    result = str(solver.check())
+    seconds = time.time() - t0
+    true_vars = None
+    if result == 'sat':
+        model = solver.model()
+        true_vars = [int(decl.name()[2:]) for decl in model.decls() if is_true(model[decl])]
+    return idx, result, seconds, true_vars
+
+def cube_and_conquer(n, m, p, r, terms=3, width=4, workers=None, timeout=None, store='cubes.db',
+                     report=10.0, **options):
+    # Returns ('sat', scheme), ('unsat', None) once every cube is refuted, or
+    # ('unknown', None) if some cube timed out. options are those of the
+    # instance cache, lex is on unless asked otherwise and cannot be combined
+    # with cyclic.
+    options.setdefault('lex', True)
+    if options.get('cyclic') is not None and (options['lex'] or options.get('lex_gamma')):
+        # The cyclic ansatz orders fixed terms and orbit representatives, not
+        # the first terms, so pruned cubes could hold the only solutions
+        raise ValueError('Lex pruned cubes are not compatible with the cyclic ansatz')
+    path = InstanceCache().instance(n, m, p, r, **options)
+    alpha, beta, gamma = load_variable_map(variable_map_path(path))
+    cubes = generate_cubes(split_variables(alpha, beta, terms, width), options['lex'] or options.get('lex_gamma'))
+    run = run_id(instance_key(n, m, p, r, **options), terms, width)
+    connection = open_store(store)
+    add_cubes(connection, run, cubes)
+    if 'sat' in cube_counts(connection, run):
+        true_vars = sat_model(connection, run)
+        connection.close()
+        print(f'Run {run} already found a sat cube')
+        # Stores from before models were kept only know the instance is sat
+        return 'sat', decode_model(path, true_vars) if true_vars is not None else None
+    pending = pending_cubes(connection, run)
+    print(f'Run {run}: {len(cubes)} cubes, {len(pending)} to solve')
+    workers = workers or os.cpu_count()
+    done, total = len(cubes) - len(pending), len(cubes)
+    t0 = last_report = time.time()
+    solved = 0
+    scheme = None
+    with multiprocessing.Pool(workers, initializer=_load, initargs=(path, timeout)) as pool:
+        for idx, result, seconds, true_vars in pool.imap_unordered(solve_cube, pending):
+            # The model of a sat cube is kept, so a resumed run still has the scheme
+            model = ' '.join(map(str, true_vars)) if true_vars is not None else None
+            connection.execute('UPDATE cubes SET result = ?, seconds = ?, finished = ?, model = ? '
+                               'WHERE run = ? AND idx = ?', (result, seconds, time.time(), model, run, idx))
+            connection.commit()
+            done += 1
+            solved += 1
+            if result == 'sat':
+                scheme = decode_model(path, true_vars)
+                print(f'Cube {idx} is sat after {done}/{total} cubes')
+                break
+            now = time.time()
+            if now - last_report >= report or done == total:
+                # Cubes finished in this run set the pace for the rest
+                eta = (now - t0) / solved * (total - done)
+                print(f'{done}/{total} cubes done ({100 * done / total:.1f}%), about {eta / 3600:.2f} hours left')
+                last_report = now
+    counts = cube_counts(connection, run)
+    connection.close()
+    if scheme is not None:
+        return 'sat', scheme
+    if counts.get('unsat', (0, 0))[0] == total:
+        return 'unsat', None
+    return 'unknown', None
+
+def main():
+    flags = dict((arg[2:].split('=', 1) + [None])[:2] for arg in sys.argv[1:] if arg.startswith('--'))
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if len(args) < 4:
+        print(f'Usage : \'python3 {sys.argv[0]} dim1 dim2 dim3 rank [--terms=3] [--width=4] [--workers=<count>] '
+              f'[--timeout=<seconds per cube>] [--store=cubes.db] [--ternary] [--no-lex] [--valid-ineq] '
+              f'[--out=<dir>]\'')
+        sys.exit(1)
+    n, m, p, r = [int(x) for x in args[:4]]
+    t0 = time.time()
+    result, scheme = cube_and_conquer(n, m, p, r, int(flags.get('terms') or 3), int(flags.get('width') or 4),
+                                      int(flags['workers']) if flags.get('workers') else None,
+                                      float(flags['timeout']) if flags.get('timeout') else None,
+                                      flags.get('store') or 'cubes.db', ternary='ternary' in flags,
+                                      lex='no-lex' not in flags, valid_ineq='valid-ineq' in flags)
+    print(f'Result: {result} ({time.time() - t0:.1f} seconds)')
+    with open('results.info', 'a') as file:
+        file.writelines([f'Mode: cube-and-conquer | Dim: {n} {m} {p} {r} | Time: {time.time() - t0}s | {result}\n'])
+    if scheme is not None:
+        out = flags.get('out') or 'schemes'
+        os.makedirs(out, exist_ok=True)
+        scheme.save(os.path.join(out, f'{n}{m}{p}_r{scheme.rank}.npz'))
+
+if __name__ == "__main__":
+    main()
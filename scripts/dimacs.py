@@ -0,0 +1,120 @@
+import os
+import numpy as np
+from mm_scheme import MM_Scheme
+
+# The header is written with a fixed width first and patched in place once
+# all clauses are out, so nothing has to be buffered. The counts are padded
+# with trailing spaces, leading zeros are not standard DIMACS.
+HEADER_DIGITS = 12
+HEADER_WIDTH = len('p cnf  ') + 2 * HEADER_DIGITS
+
+def header_line(num_vars: int, num_clauses: int) -> str:
+    return f'p cnf {num_vars} {num_clauses}'.ljust(HEADER_WIDTH) + '\n'
+
+def format_clauses(clauses: np.ndarray) -> str:
+    # DIMACS lines for zero padded clause rows, rows of equal length are
+    # formatted together with a single format string
+    clauses = np.asarray(clauses)
+    lengths = np.count_nonzero(clauses, axis=1)
+    lines = [None] * len(clauses)
+    for width in np.unique(lengths):
+        rows = np.flatnonzero(lengths == width)
+        fmt = '%d ' * width + '0'
+        # Padding is always at the end of a row, so the first width entries are the literals
+        for idx, row in zip(rows.tolist(), clauses[rows, :width].tolist()):
+            lines[idx] = fmt % tuple(row)
+    return '\n'.join(lines) + '\n' if lines else ''
+
+def write_dimacs(path: str, clause_chunks, num_vars=None, comments=()):
+    # Stream clause chunks to a DIMACS file. num_vars can be an int, a callable
+    # evaluated after the last chunk (for encoders that allocate variables as
+    # they go) or None to use the largest variable seen.
+    num_clauses = 0
+    max_var = 0
+    with open(path, 'w') as file:
+        for comment in comments:
+            file.write(f'c {comment}\n')
+        header_offset = file.tell()
+        file.write(header_line(0, 0))
+        for clauses in clause_chunks:
+            if len(clauses) == 0:
+                continue
+            num_clauses += len(clauses)
+            max_var = max(max_var, int(np.abs(clauses).max()))
+            file.write(format_clauses(clauses))
+        if callable(num_vars):
+            num_vars = num_vars()
+        if num_vars is None:
+            num_vars = max_var
+        header = header_line(num_vars, num_clauses)
+        if len(header) > HEADER_WIDTH + 1:
+            # It would run into the first clause
+            raise ValueError(f'Header {header.strip()!r} does not fit the {HEADER_WIDTH} reserved characters')
+        file.seek(header_offset)
+        file.write(header)
+    return num_vars, num_clauses
+
+# Variable map sidecars: for every factor an int array indexed by
+# [term, row, col] holding the DIMACS id of that coefficient (0 if the
+# coefficient does not occur in the file). Ternary encodings also store the
+# ids of the negative bits as alpha_neg, beta_neg and gamma_neg.
+def variable_map_path(cnf_path: str) -> str:
+    root, _ = os.path.splitext(cnf_path)
+    return root + '.vars.npz'
+
+def save_variable_map(path: str, alpha, beta, gamma, signs=None) -> None:
+    arrays = {'alpha': alpha, 'beta': beta, 'gamma': gamma}
+    if signs is not None:
+        arrays.update(zip(('alpha_neg', 'beta_neg', 'gamma_neg'), signs))
+    np.savez_compressed(path, **{name: np.asarray(ids, dtype=np.int32) for name, ids in arrays.items()})
+
+def load_variable_map(path: str):
+    with np.load(path) as data:
+        return data['alpha'], data['beta'], data['gamma']
+
+def load_sign_map(path: str):
+    # The negative bit ids of a ternary encoding, None for F_2 encodings
+    with np.load(path) as data:
+        if 'alpha_neg' not in data:
+            return None
+        return data['alpha_neg'], data['beta_neg'], data['gamma_neg']
+
+def read_solution(lines, num_vars=None, comment=None):
+    # Parse solver output ('s' and 'v' lines, anything else is ignored) into
+    # the status string and a bool array indexed by variable id. Values are
+    # filled in line by line, so the output is never held as a whole, and
+    # comment (if given) is called with the text of every 'c' line.
+    status = None
+    assignment = np.zeros((num_vars or 0) + 1, dtype=bool)
+    top = num_vars or 0
+    for line in lines:
+        if line.startswith('s '):
+            status = line[2:].strip()
+        elif line.startswith('v '):
+            lits = np.array(line[2:].split(), dtype=np.int64)
+            lits = lits[lits != 0]
+            if not len(lits):
+                continue
+            top = max(top, int(np.abs(lits).max()))
+            if top >= len(assignment):
+                assignment = np.concatenate([assignment, np.zeros(max(top + 1, 2 * len(assignment))
+                                                                  - len(assignment), dtype=bool)])
+            assignment[np.abs(lits)] = lits > 0
+        elif comment is not None and line.startswith('c'):
+            comment(line[1:].strip())
+    return status, assignment[:top + 1]
+
+def decode_scheme(assignment, alpha, beta, gamma, signs=None) -> MM_Scheme:
+    # Look up every coefficient at once, id 0 is never assigned and reads as 0.
+    # A model that stops short of some coefficients (a solver printing a
+    # partial model, truncated output) is refused rather than read as zeros.
+    assignment = np.asarray(assignment, dtype=bool)
+    ids = np.concatenate([np.ravel(x) for x in (alpha, beta, gamma, *(signs if signs is not None else ()))])
+    missing = np.unique(ids[ids >= len(assignment)])
+    if len(missing):
+        shown = ' '.join(str(v) for v in missing[:10].tolist()) + (' ...' if len(missing) > 10 else '')
+        raise ValueError(f'Partial model, {len(missing)} variables of the scheme have no value: {shown}')
+    U, V, W = [assignment[ids].astype(np.int8) for ids in (alpha, beta, gamma)]
+    if signs is not None:
+        U, V, W = [X * (1 - 2 * assignment[ids].astype(np.int8)) for X, ids in zip((U, V, W), signs)]
+    return MM_Scheme(U, V, W)
@@ -0,0 +1,125 @@
+import os
+import sys
+import time
+import numpy as np
+from brent_cnf import BrentEncoder
+from cardinality import clause_array
+from mm_scheme import MM_Scheme
+from scheme_index import DEFAULT_MAX_GROUP, canonical_form, orbit, scheme_key
+from ternary_cnf import TernaryEncoder
+from z3_solve import add_cnf, build_solver, encoder_literals, model_assignment
+from z3 import sat
+
+# Enumeration of all schemes of rank exactly r up to equivalence. Every term
+# is nonzero, terms are lex ordered and, for ternary-sat, signs normalized,
+# so a scheme has one assignment per image under the finite symmetry group
+# of scheme_index. After each model the assignments of all images are
+# blocked, which also excludes the symmetric copies. Terms that tie in the
+# lex order, and the continuous part of the symmetry group over Z, can still
+# let an equivalent model through, those are blocked but not recorded again
+# since their canonical key is known. Canonical forms are appended as fixed
+# size int8 records (r terms of alpha, beta and gamma entries) and a
+# restarted run blocks the recorded ones before solving.
+
+FIELD = {'sat': 'F2', 'ternary-sat': 'Z'}
+
+def record_size(n, m, p, r) -> int:
+    return r * (n * m + m * p + n * p)
+
+def read_records(path, n, m, p, r):
+    # Schemes of a record file, a partial last record (interrupted write) is ignored
+    if not os.path.exists(path):
+        return
+    size = record_size(n, m, p, r)
+    with open(path, 'rb') as file:
+        while True:
+            data = file.read(size)
+            if len(data) < size:
+                return
+            rows = np.frombuffer(data, dtype=np.int8).reshape(r, -1)
+            U, V, W = np.split(rows, [n * m, n * m + m * p], axis=1)
+            yield MM_Scheme(U.reshape(r, n, m), V.reshape(r, m, p), W.reshape(r, n, p))
+
+def write_record(file, scheme: MM_Scheme) -> None:
+    r = scheme.rank
+    rows = np.concatenate([X.reshape(r, -1) for X in (scheme.U, scheme.V, scheme.W)], axis=1)
+    file.write(rows.astype(np.int8).tobytes())
+    file.flush()
+    os.fsync(file.fileno())
+
+def nonzero_term_clauses(encoder) -> np.ndarray:
+    # Every alpha, beta and gamma matrix of every term has a nonzero entry
+    return clause_array([factor[l].reshape(-1).tolist() for factor in (encoder.alpha, encoder.beta, encoder.gamma)
+                         for l in range(encoder.r)])
+
+def blocking_clauses(encoder, scheme: MM_Scheme, field, max_group=DEFAULT_MAX_GROUP) -> np.ndarray:
+    # One clause per image of the scheme excluding its (lex sorted) assignment
+    rows = []
+    for image in orbit(scheme, field, max_group):
+        if field == 'Z':
+            # The ternary sign symmetry clauses make the first nonzero alpha
+            # and gamma entries -1, (a, b, c) -> (-a, b, -c) keeps the term
+            image = MM_Scheme(-image.U, image.V, -image.W)
+        assignment = encoder.scheme_assignment(image)
+        rows.append([-var if value else var for var, value in assignment.items()])
+    return clause_array(rows)
+
+def enumerate_schemes(n, m, p, r, mode='sat', path=None, limit=None, max_group=DEFAULT_MAX_GROUP,
+                      cardinality='totalizer'):
+    # Yields canonical schemes as they are found and appended to path
+    field = FIELD[mode]
+    coefficients = [0, 1] if mode == 'sat' else [-1, 0, 1]
+    path = path or f'{n}{m}{p}_r{r}_{field}.bin'
+    solver = build_solver(n, m, p, r, mode, coefficients, lex=True, lex_gamma=False, sign_sym=mode == 'ternary-sat',
+                          valid_ineq=False, cardinality=cardinality)
+    # Same ids and names as the encoder build_solver used
+    encoder = BrentEncoder(n, m, p, r) if mode == 'sat' else TernaryEncoder(n, m, p, r, cardinality)
+    literals = encoder_literals(encoder)
+    add_cnf(solver, nonzero_term_clauses(encoder), literals)
+    found = 0
+    keys = set()
+    for scheme in read_records(path, n, m, p, r):
+        add_cnf(solver, blocking_clauses(encoder, scheme, field, max_group), literals)
+        keys.add(scheme_key(scheme, field))
+        found += 1
+    if found:
+        print(f'Resuming after {found} schemes in {path}')
+    with open(path, 'ab') as file:
+        # Drop a partial record left by an interrupted write
+        file.truncate(found * record_size(n, m, p, r))
+        while limit is None or found < limit:
+            if solver.check() != sat:
+                return
+            assignment = model_assignment(solver.model(), literals)
+            canonical = canonical_form(encoder.decode(assignment), field, max_group)
+            # The raw model too, in case lex ties let it differ from the sorted images
+            add_cnf(solver, clause_array([[-var if assignment[var] else var
+                                           for l in range(r) for var in encoder.term_variables(l).tolist()]]),
+                    literals)
+            add_cnf(solver, blocking_clauses(encoder, canonical, field, max_group), literals)
+            key = scheme_key(canonical, field)
+            if key in keys:
+                continue
+            keys.add(key)
+            write_record(file, canonical)
+            found += 1
+            yield canonical
+
+def main():
+    flags = dict(arg[2:].split('=', 1) for arg in sys.argv[1:] if arg.startswith('--') and '=' in arg)
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if len(args) < 4:
+        print(f'Usage : \'python3 {sys.argv[0]} dim1 dim2 dim3 rank [--mode=sat|ternary-sat] [--out=<file.bin>] '
+              f'[--limit=<count>]\'')
+        sys.exit(1)
+    n, m, p, r = [int(x) for x in args[:4]]
+    t0 = time.time()
+    count = 0
+    for scheme in enumerate_schemes(n, m, p, r, flags.get('mode', 'sat'), flags.get('out'),
+                                    int(flags['limit']) if 'limit' in flags else None):
+        count += 1
+        print(f'Scheme {count} after {time.time() - t0:.1f} seconds')
+    print(f'{count} new schemes in {time.time() - t0:.1f} seconds')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+import multiprocessing
+import os
+import random
+import sys
+import time
+import numpy as np
+from gf2_scheme import from_mm_scheme, is_valid, to_mm_scheme
+from mm_scheme import MM_Scheme, standard_scheme
+from scheme_index import SchemeIndex
+
+# Random walks on the flip graph of F_2 schemes (Kauers and Moosbauer). Terms
+# are triples of bit-packed factor matrices (the gf2_scheme layout, one int
+# per factor). Two terms sharing a factor, say a (x) b (x) c + a (x) b' (x) c',
+# can be rewritten as a (x) (b + b') (x) c + a (x) b' (x) (c + c') without
+# changing their sum. That is a flip. When a flip zeroes a factor the term
+# vanishes, and two terms sharing two factors merge into one: both reduce
+# the rank. If the walk stalls, a plus transition trades one extra term for
+# new flips.
+
+class FlipWalker:
+    def __init__(self, scheme: MM_Scheme, seed=None):
+        self.dimension = scheme.dimension
+        self.rng = random.Random(seed)
+        a, b, c = from_mm_scheme(scheme)
+        # factors[k][l] is factor k of term l
+        self.factors = [[int(x) for x in a], [int(x) for x in b], [int(x) for x in c]]
+        # index[k] maps a factor value to the terms that have it
+        self.index = [{}, {}, {}]
+        for k in range(3):
+            for l, x in enumerate(self.factors[k]):
+                self.index[k].setdefault(x, []).append(l)
+        for l in reversed(range(self.rank)):
+            if l < self.rank and not all(self.factors[k][l] for k in range(3)):
+                self._remove(l)
+        self.steps = 0
+
+    @property
+    def rank(self) -> int:
+        return len(self.factors[0])
+
+    def scheme(self) -> MM_Scheme:
+        return to_mm_scheme(*[np.array(f, dtype=np.uint64) for f in self.factors], self.dimension)
+
+    def _set(self, k, l, x):
+        old = self.factors[k][l]
+        bucket = self.index[k][old]
+        bucket.remove(l)
+        if not bucket:
+            del self.index[k][old]
+        self.factors[k][l] = x
+        self.index[k].setdefault(x, []).append(l)
+
+    def _remove(self, l):
+        # Move the last term into slot l
+        last = self.rank - 1
+        for k in range(3):
+            factors, index = self.factors[k], self.index[k]
+            bucket = index[factors[l]]
+            bucket.remove(l)
+            if not bucket:
+                del index[factors[l]]
+            if l != last:
+                bucket = index[factors[last]]
+                bucket[bucket.index(last)] = l
+                factors[l] = factors[last]
+            factors.pop()
+
+    def _reduce(self, l) -> bool:
+        # Drop term l if it vanished or merge it with a term sharing two of
+        # its factors, True when the rank went down
+        if not all(self.factors[k][l] for k in range(3)):
+            self._remove(l)
+            return True
+        for k in range(3):
+            k1, k2 = (k + 1) % 3, (k + 2) % 3
+            for j in self.index[k1][self.factors[k1][l]]:
+                if j != l and self.factors[k2][j] == self.factors[k2][l]:
+                    # Same k1 and k2 factors: add the k factors into term j
+                    x = self.factors[k][j] ^ self.factors[k][l]
+                    self._remove(l)
+                    if j == self.rank:
+                        j = l
+                    self._set(k, j, x)
+                    self._reduce(j)
+                    return True
+        return False
+
+    def flip(self) -> bool:
+        # One random flip, False if the sampled term shares no factor
+        k = self.rng.randrange(3)
+        i = self.rng.randrange(self.rank)
+        bucket = self.index[k][self.factors[k][i]]
+        if len(bucket) < 2:
+            return False
+        j = bucket[self.rng.randrange(len(bucket) - 1)]
+        if j == i:
+            j = bucket[-1]
+        k1, k2 = (k + 1) % 3, (k + 2) % 3
+        self._set(k1, i, self.factors[k1][i] ^ self.factors[k1][j])
+        self._set(k2, j, self.factors[k2][j] ^ self.factors[k2][i])
+        self.steps += 1
+        # Reduce the higher slot first so removing it cannot move the other
+        high, low = max(i, j), min(i, j)
+        reduced = self._reduce(high)
+        if low < self.rank:
+            reduced = self._reduce(low) or reduced
+        return reduced
+
+    def plus(self) -> None:
+        # a(x)b(x)c + a'(x)b'(x)c' = (a+a')(x)b(x)c + a'(x)(b+b')(x)c + a'(x)b'(x)(c+c')
+        i, j = self.rng.sample(range(self.rank), 2)
+        (a, b, c), (a2, b2, c2) = [[self.factors[k][l] for k in range(3)] for l in (i, j)]
+        if a == a2 or b == b2 or c == c2:
+            return
+        self._set(0, i, a ^ a2)
+        self._set(1, j, b ^ b2)
+        self._set(2, j, c)
+        new = self.rank
+        for k, x in enumerate((a2, b2, c ^ c2)):
+            self.factors[k].append(x)
+            self.index[k].setdefault(x, []).append(new)
+
+    def walk(self, steps, target_rank=None, plateau=100000, max_rank=None):
+        # Walk for the given number of flips, stopping early at target_rank.
+        # Returns the lowest rank scheme seen.
+        max_rank = max_rank or self.rank + 2
+        best = self.scheme()
+        since = 0
+        for _ in range(steps):
+            if self.flip() and self.rank < best.rank:
+                best = self.scheme()
+                since = 0
+                if target_rank is not None and self.rank <= target_rank:
+                    break
+            since += 1
+            if since >= plateau and self.rank < max_rank and self.rank >= 2:
+                self.plus()
+                since = 0
+        return best
+
+def walker_task(args):
+    scheme, steps, target_rank, plateau, seed = args
+    walker = FlipWalker(scheme, seed)
+    t0 = time.time()
+    best = walker.walk(steps, target_rank, plateau)
+    return best, walker.steps, time.time() - t0
+
+def flip_search(scheme: MM_Scheme, steps=10**6, target_rank=None, walkers=None, plateau=100000, seed=0):
+    # Independent walkers in parallel processes, returns the best scheme
+    # (checked over F_2) and the total number of flips
+    walkers = walkers or os.cpu_count()
+    tasks = [(scheme, steps, target_rank, plateau, seed + w) for w in range(walkers)]
+    with multiprocessing.Pool(walkers) as pool:
+        results = pool.map(walker_task, tasks)
+    best = min((result[0] for result in results), key=lambda s: s.rank)
+    a, b, c = from_mm_scheme(best)
+    if not is_valid(a, b, c, best.dimension):
+        raise RuntimeError('Flip walk produced an invalid scheme')
+    return best, sum(result[1] for result in results)
+
+def main():
+    flags = dict(arg[2:].split('=', 1) for arg in sys.argv[1:] if arg.startswith('--') and '=' in arg)
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if len(args) < 3:
+        print(f'Usage : \'python3 {sys.argv[0]} dim1 dim2 dim3 [target_rank] [--start=scheme.npz] [--steps=<flips>] '
+              f'[--walkers=<count>] [--plateau=<flips>] [--seed=<seed>] [--out=<dir>] '
+              f'[--index=<schemes.db>]\'')
+        sys.exit(1)
+    n, m, p = [int(x) for x in args[:3]]
+    target_rank = int(args[3]) if len(args) > 3 else None
+    scheme = MM_Scheme.load(flags['start']) if 'start' in flags else standard_scheme(n, m, p)
+    t0 = time.time()
+    best, steps = flip_search(scheme, int(flags.get('steps', 10**6)), target_rank, int(flags.get('walkers', 0)) or None,
+                              int(flags.get('plateau', 100000)), int(flags.get('seed', 0)))
+    elapsed = time.time() - t0
+    print(f'Rank {scheme.rank} -> {best.rank} after {steps} flips in {elapsed:.1f} seconds '
+          f'({steps / elapsed:.0f} flips/s)')
+    out = flags.get('out', 'schemes')
+    filename = os.path.join(out, f'{n}{m}{p}_r{best.rank}_f2.npz')
+    if 'index' in flags and not SchemeIndex(flags['index'], 'F2').add(best, filename)[1]:
+        print('Equivalent to a scheme already in the index, not saved')
+        return
+    os.makedirs(out, exist_ok=True)
+    best.save(filename)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import numpy as np
+
+# Linear systems over F_2 with rows bit-packed into uint64 words, column c
+# of a row is bit c % 64 of word c // 64.
+
+def pack_rows(A) -> np.ndarray:
+    # (rows, cols) 0/1 matrix -> (rows, words) uint64
+    A = np.asarray(A, dtype=bool)
+    words = (A.shape[1] + 63) // 64
+    padded = np.zeros((A.shape[0], words * 64), dtype=bool)
+    padded[:, :A.shape[1]] = A
+    return np.packbits(padded, axis=1, bitorder='little').view('<u8').astype(np.uint64)
+
+def _column(M, col):
+    word, bit = divmod(col, 64)
+    return ((M[:, word] >> np.uint64(bit)) & np.uint64(1)).astype(bool)
+
+def row_reduce(M, num_cols):
+    # Gauss-Jordan elimination of the packed rows M in place over the first
+    # num_cols columns. Returns the pivot columns (pivot i is in row i) and
+    # the row permutation applied (row i came from row perm[i]).
+    perm = np.arange(len(M))
+    pivots = []
+    for col in range(num_cols):
+        row = len(pivots)
+        if row == len(M):
+            break
+        candidates = np.flatnonzero(_column(M[row:], col))
+        if len(candidates) == 0:
+            continue
+        pick = row + candidates[0]
+        if pick != row:
+            M[[row, pick]] = M[[pick, row]]
+            perm[[row, pick]] = perm[[pick, row]]
+        mask = _column(M, col)
+        mask[row] = False
+        M[mask] ^= M[row]
+        pivots.append(col)
+    return np.array(pivots, dtype=np.int64), perm
+
+def solve(A, b):
+    # One solution of A x = b over F_2, free variables set to 0. Returns
+    # (x, None) or (None, rows) where rows are equations (indices into A)
+    # that are inconsistent with the rest of the system.
+    A = np.asarray(A, dtype=bool)
+    num_rows, num_cols = A.shape
+    M = pack_rows(np.concatenate([A, np.asarray(b, dtype=bool).reshape(-1, 1)], axis=1))
+    pivots, perm = row_reduce(M, num_cols)
+    rhs = _column(M, num_cols)
+    inconsistent = np.flatnonzero(rhs[len(pivots):]) + len(pivots)
+    if len(inconsistent):
+        return None, np.sort(perm[inconsistent])
+    x = np.zeros(num_cols, dtype=bool)
+    x[pivots] = rhs[:len(pivots)]
+    return x, None
+
+def nullspace(A) -> np.ndarray:
+    # Basis of {x : A x = 0} over F_2 as rows of a bool array
+    A = np.asarray(A, dtype=bool)
+    num_cols = A.shape[1]
+    M = pack_rows(A)
+    pivots, _ = row_reduce(M, num_cols)
+    free = np.setdiff1d(np.arange(num_cols), pivots)
+    reduced = np.stack([_column(M[:len(pivots)], col) for col in free], axis=1) if len(free) else None
+    basis = np.zeros((len(free), num_cols), dtype=bool)
+    for idx, col in enumerate(free):
+        basis[idx, col] = True
+        basis[idx, pivots] = reduced[:, idx]
+    return basis
@@ -0,0 +1,84 @@
+from functools import lru_cache
+import numpy as np
+from mm_scheme import MM_Scheme, mm_tensor
+
+# Bit-packed arithmetic for schemes over F_2. Every factor matrix is a single
+# uint64 word, entry (i, j) of an rows x cols matrix is bit i*cols + j, so
+# blocks up to 8x8 fit in one word. A scheme is the triple of arrays (a, b, c)
+# of shape (..., r), leading axes index a batch of schemes.
+#
+# Tensors are stored as (..., nm, mp) word arrays: word [x, y] holds the bits
+# of all np gamma entries z for which the coefficient at (x, y, z) is 1, so a
+# rank one term a (x) b (x) c is c placed at every (x, y) with x in a, y in b.
+
+WORD_BITS = 64
+ONE = np.uint64(1)
+
+def _check_size(*sizes):
+    if max(sizes) > WORD_BITS:
+        raise ValueError(f'Factor matrices with more than {WORD_BITS} entries do not fit in a word')
+
+def pack(matrices) -> np.ndarray:
+    # (..., rows, cols) 0/1 matrices -> (...) uint64 words
+    matrices = np.asarray(matrices)
+    bits = matrices.reshape(matrices.shape[:-2] + (-1,)).astype(np.uint64) & ONE
+    _check_size(bits.shape[-1])
+    weights = ONE << np.arange(bits.shape[-1], dtype=np.uint64)
+    return np.bitwise_or.reduce(bits * weights, axis=-1)
+
+def unpack_bits(words, size: int) -> np.ndarray:
+    # (...) uint64 words -> (..., size) bool
+    words = np.asarray(words, dtype=np.uint64)
+    return ((words[..., None] >> np.arange(size, dtype=np.uint64)) & ONE).astype(bool)
+
+def unpack(words, rows: int, cols: int) -> np.ndarray:
+    return unpack_bits(words, rows * cols).reshape(np.shape(words) + (rows, cols)).astype(np.int8)
+
+if hasattr(np, 'bitwise_count'):
+    def popcount(words) -> np.ndarray:
+        return np.bitwise_count(np.asarray(words, dtype=np.uint64)).astype(np.int64)
+else:
+    _BYTE_COUNTS = np.array([bin(x).count('1') for x in range(256)], dtype=np.int64)
+
+    def popcount(words) -> np.ndarray:
+        words = np.ascontiguousarray(words, dtype=np.uint64)
+        return _BYTE_COUNTS[words.view(np.uint8)].reshape(words.shape + (8,)).sum(axis=-1)
+
+def from_mm_scheme(scheme: MM_Scheme):
+    n, m, p = scheme.dimension
+    _check_size(n * m, m * p, n * p)
+    return pack(scheme.U % 2), pack(scheme.V % 2), pack(scheme.W % 2)
+
+def to_mm_scheme(a, b, c, dimension) -> MM_Scheme:
+    n, m, p = dimension
+    return MM_Scheme(unpack(a, n, m), unpack(b, m, p), unpack(c, n, p))
+
+@lru_cache(maxsize=None)
+def mm_target(n: int, m: int, p: int) -> np.ndarray:
+    # The MM tensor in the packed (nm, mp) layout
+    _check_size(n * m, m * p, n * p)
+    target = pack(mm_tensor(n, m, p)[..., None, :])
+    target.setflags(write=False)
+    return target
+
+def term_tensors(a, b, c, dimension) -> np.ndarray:
+    # Rank one tensors of the individual terms, (..., nm, mp) words
+    n, m, p = dimension
+    a_bits = unpack_bits(a, n * m)
+    b_bits = unpack_bits(b, m * p)
+    support = a_bits[..., :, None] & b_bits[..., None, :]
+    return np.where(support, np.asarray(c, dtype=np.uint64)[..., None, None], np.uint64(0))
+
+def scheme_tensor(a, b, c, dimension) -> np.ndarray:
+    # XOR of the rank one tensors of all terms, (..., nm, mp) words
+    return np.bitwise_xor.reduce(term_tensors(a, b, c, dimension), axis=-3)
+
+def residual(a, b, c, dimension) -> np.ndarray:
+    return scheme_tensor(a, b, c, dimension) ^ mm_target(*dimension)
+
+def residual_weight(a, b, c, dimension) -> np.ndarray:
+    # Number of violated Brent equations of every scheme in the batch
+    return popcount(residual(a, b, c, dimension)).sum(axis=(-2, -1))
+
+def is_valid(a, b, c, dimension) -> np.ndarray:
+    return ~residual(a, b, c, dimension).any(axis=(-2, -1))
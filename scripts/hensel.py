@@ -0,0 +1,113 @@
+import sys
+import numpy as np
+from gf2_linalg import solve
+from mm_scheme import MM_Scheme, mm_tensor
+
+# Hensel lifting of schemes over F_2 to schemes over Z. With x valid mod 2^k
+# (k >= 1) and residual T(x) - T_MM = 2^k R, the trilinear Brent map gives
+# T(x + 2^k d) = T(x) + 2^k J d mod 2^(k+1), with J the Jacobian of T at x.
+# Mod 2, J only depends on the F_2 scheme, so every step solves J d = R over
+# F_2 with the same matrix. Coefficients are kept as symmetric residues, so
+# a lifted scheme with small integer coefficients shows up as an exact
+# solution once the precision is high enough.
+
+def flatten(scheme: MM_Scheme) -> np.ndarray:
+    r = scheme.rank
+    return np.concatenate([X.reshape(r, -1) for X in (scheme.U, scheme.V, scheme.W)], axis=1).reshape(-1)
+
+def unflatten(x, dimension, rank) -> MM_Scheme:
+    n, m, p = dimension
+    x = np.asarray(x).reshape(rank, -1)
+    U, V, W = np.split(x, [n * m, n * m + m * p], axis=1)
+    return MM_Scheme(U.reshape(rank, n, m), V.reshape(rank, m, p), W.reshape(rank, n, p))
+
+def residual(x, dimension, rank) -> np.ndarray:
+    # T(x) - T_MM for flattened int64 coefficients, which may not fit in int8
+    n, m, p = dimension
+    x = np.asarray(x, dtype=np.int64).reshape(rank, -1)
+    a, b, c = np.split(x, [n * m, n * m + m * p], axis=1)
+    return np.einsum('la,lb,lc->abc', a, b, c).reshape(-1) - mm_tensor(n, m, p).reshape(-1)
+
+def jacobian(scheme: MM_Scheme) -> np.ndarray:
+    # (equations, unknowns) bool matrix of d T / d x mod 2, unknowns ordered
+    # term by term, alpha then beta then gamma entries as in flatten
+    n, m, p = scheme.dimension
+    r = scheme.rank
+    a, b, c = [X.reshape(r, -1).astype(bool) for X in (scheme.U, scheme.V, scheme.W)]
+    nm, mp, np_ = n * m, m * p, n * p
+    J = np.zeros((nm, mp, np_, r, nm + mp + np_), dtype=bool)
+    for l in range(r):
+        bc = b[l][:, None] & c[l][None, :]
+        ac = a[l][:, None] & c[l][None, :]
+        ab = a[l][:, None] & b[l][None, :]
+        for x in range(nm):
+            J[x, :, :, l, x] = bc
+        for y in range(mp):
+            J[:, y, :, l, nm + y] = ac
+        for z in range(np_):
+            J[:, :, z, l, nm + mp + z] = ab
+    return J.reshape(nm * mp * np_, -1)
+
+def symmetric_residue(x, modulus: int) -> np.ndarray:
+    # Representatives in (-modulus / 2, modulus / 2]
+    x = np.mod(x, modulus)
+    return np.where(x > modulus // 2, x - modulus, x)
+
+def equation_rows(equations, dimension) -> np.ndarray:
+    # Flat equation indices as (i1, i2, j1, j2, k1, k2) rows, like MM_Scheme.verify
+    n, m, p = dimension
+    a, b, c = np.unravel_index(np.asarray(equations, dtype=np.int64), (n * m, m * p, n * p))
+    return np.stack([a // m, a % m, b // p, b % p, c // p, c % p], axis=1)
+
+def hensel_lift(scheme: MM_Scheme, max_precision=8):
+    # Lift a scheme valid over F_2 to one valid over Z. Returns (lifted
+    # scheme, empty rows) on success and (None, rows) otherwise, where rows
+    # are the Brent equations (as in MM_Scheme.verify) that block the lift:
+    # an inconsistent linear system, or the equations still violated over Z
+    # at max_precision bits.
+    if not scheme.is_valid('F2'):
+        return None, scheme.verify('F2')
+    dimension, rank = scheme.dimension, scheme.rank
+    x = flatten(scheme).astype(np.int64) % 2
+    J = jacobian(unflatten(x, dimension, rank))
+    # Corrections on the support of the F_2 scheme only flip signs, so they
+    # are tried first and the full system is the fallback
+    support = np.flatnonzero(x)
+    for k in range(1, max_precision):
+        R = residual(x, dimension, rank)
+        if not R.any():
+            return unflatten(x, dimension, rank), np.zeros((0, 6), dtype=np.int64)
+        rhs = (R >> k) & 1
+        d_support, _ = solve(J[:, support], rhs)
+        if d_support is not None:
+            d = np.zeros(len(x), dtype=bool)
+            d[support] = d_support
+        else:
+            d, inconsistent = solve(J, rhs)
+            if d is None:
+                return None, equation_rows(inconsistent, dimension)
+        # Subtracting keeps 1 - 2 = -1 for the sign flips {-1, 0, 1} schemes need
+        x = symmetric_residue(x - (d.astype(np.int64) << k), 1 << (k + 1))
+    R = residual(x, dimension, rank)
+    if R.any():
+        return None, equation_rows(np.flatnonzero(R), dimension)
+    return unflatten(x, dimension, rank), np.zeros((0, 6), dtype=np.int64)
+
+def main():
+    if len(sys.argv) < 2:
+        print(f'Usage : \'python3 {sys.argv[0]} scheme.npz [lifted.npz] [max_precision]\'')
+        sys.exit(1)
+    scheme = MM_Scheme.load(sys.argv[1])
+    max_precision = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+    lifted, violated = hensel_lift(scheme, max_precision)
+    if lifted is None:
+        print(f'No lift, {len(violated)} obstructing equations (i1 i2 j1 j2 k1 k2):')
+        print(violated)
+        sys.exit(1)
+    print(lifted)
+    print(f'Coefficients: {np.unique(flatten(lifted)).tolist()}')
+    if len(sys.argv) > 2:
+        lifted.save(sys.argv[2])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import tempfile
+from brent_cnf import BrentEncoder
+from cardinality import family_encodings, valid_inequality_clauses
+from dimacs import save_variable_map, variable_map_path, write_dimacs
+from instrument import Recorder
+from ternary_cnf import TernaryEncoder
+
+# On-disk cache of DIMACS instances keyed by a hash of everything that
+# changes the formula. Bump ENCODER_VERSION whenever the encoders change the
+# clauses they produce, so stale instances are never served.
+ENCODER_VERSION = 3
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cnf_cache')
+DEFAULT_MAX_BYTES = 2 << 30
+
+def instance_options(ternary=False, lex=False, lex_gamma=False, valid_ineq=False, cardinality='totalizer',
+                     sign_sym=False, cyclic=None) -> dict:
+    # Normalized options, settings without any effect on the formula are dropped
+    options = {
+        'field': 'Z' if ternary else 'F2',
+        'coefficients': [-1, 0, 1] if ternary else [0, 1],
+        'lex': bool(lex or lex_gamma),
+        'lex_gamma': bool(lex_gamma),
+        'valid_ineq': bool(valid_ineq),
+        'sign_sym': bool(ternary and sign_sym),
+    }
+    if ternary or valid_ineq:
+        # Per family encodings get integer families, whichever way they came
+        options['cardinality'] = cardinality if isinstance(cardinality, str) else family_encodings(cardinality)
+    if cyclic is not None:
+        options['cyclic'] = int(cyclic)
+    return options
+
+def instance_key(n, m, p, r, **options) -> str:
+    key = {'dimension': [n, m, p], 'rank': r, 'options': instance_options(**options), 'version': ENCODER_VERSION}
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+def write_instance(filename, n, m, p, r, lex=False, lex_gamma=False, valid_ineq=False, cardinality='totalizer',
+                   ternary=False, sign_sym=False, cyclic=None, recorder=None):
+    # Stream the encoding to a DIMACS file and its variable map sidecar,
+    # clauses are written one equation at a time as they are encoded. With a
+    # recorder the generation of every constraint family is timed.
+    recorder = recorder or Recorder()
+    with recorder.phase('encoder') as record:
+        if ternary:
+            encoder = TernaryEncoder(n, m, p, r, cardinality, cyclic)
+        else:
+            encoder = BrentEncoder(n, m, p, r, cyclic)
+        record['variables'] = encoder.num_vars
+    def chunks():
+        yield from recorder.chunks('brent_equations', encoder.clauses(chunk_size=1), encoder)
+        if lex or lex_gamma:
+            yield from recorder.chunks('lex', lambda: encoder.lex_clauses(include_gamma=lex_gamma), encoder)
+        if ternary and sign_sym:
+            yield from recorder.chunks('sign_symmetries', encoder.sign_symmetry_clauses, encoder)
+        if valid_ineq:
+            if ternary:
+                yield from recorder.chunks('valid_inequalities', encoder.valid_inequality_clauses, encoder)
+            else:
+                yield from recorder.chunks('valid_inequalities',
+                                           lambda: valid_inequality_clauses(encoder, cardinality), encoder)
+    if ternary:
+        comments = [f'Brent equations over Z with coefficients in {{-1,0,1}} for <{n},{m},{p}>, rank <= {r}']
+    else:
+        comments = [f'Brent equations over F_2 for <{n},{m},{p}>, rank <= {r}']
+    if cyclic is not None:
+        comments.append(f'cyclic-symmetric ansatz with {cyclic} fixed terms')
+    if lex or lex_gamma:
+        comments.append(f'lex ordered terms{" (including gamma)" if lex_gamma else ""}')
+    if ternary and sign_sym:
+        comments.append('sign symmetries')
+    if valid_ineq:
+        comments.append(f'valid inequalities ({cardinality} cardinality encoding)')
+    with recorder.phase('write_dimacs') as record:
+        counts = write_dimacs(filename, chunks(), lambda: encoder.num_vars, comments)
+        record['variables'], record['clauses'] = counts
+    signs = (encoder.alpha_neg, encoder.beta_neg, encoder.gamma_neg) if ternary else None
+    save_variable_map(variable_map_path(filename), encoder.alpha, encoder.beta, encoder.gamma, signs)
+    return counts
+
+class InstanceCache:
+    """DIMACS files and their variable maps stored as <key>.cnf and
+    <key>.vars.npz. The modification time of the .cnf file is its last use,
+    the least recently used instances are evicted once the cache grows past
+    max_bytes. Files are written under a temporary name and renamed, so
+    concurrent workers never see a partial instance.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f'{key}.cnf')
+
+    def get(self, key: str):
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key: str, build) -> str:
+        # build(filename) writes the DIMACS file and its sidecar
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp.cnf')
+        os.close(fd)
+        try:
+            build(tmp)
+            # The sidecar goes first, a present .cnf means a complete entry
+            if os.path.exists(variable_map_path(tmp)):
+                os.replace(variable_map_path(tmp), variable_map_path(self.path(key)))
+            os.replace(tmp, self.path(key))
+        finally:
+            for leftover in (tmp, variable_map_path(tmp)):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+        self.evict(keep=key)
+        return self.path(key)
+
+    def entries(self) -> list:
+        # (last use, bytes, key) of every complete entry, oldest first
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.cnf') or name.endswith('.tmp.cnf'):
+                continue
+            key = name[:-len('.cnf')]
+            path = self.path(key)
+            try:
+                size = os.path.getsize(path)
+                if os.path.exists(variable_map_path(path)):
+                    size += os.path.getsize(variable_map_path(path))
+                entries.append((os.path.getmtime(path), size, key))
+            except FileNotFoundError:
+                continue
+        return sorted(entries)
+
+    def evict(self, keep=None) -> None:
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            for path in (self.path(key), variable_map_path(self.path(key))):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total -= size
+
+    def instance(self, n, m, p, r, **options) -> str:
+        # Path of the cached instance, encoded first if it is not there yet
+        key = instance_key(n, m, p, r, **options)
+        return self.get(key) or self.put(key, lambda filename: write_instance(filename, n, m, p, r, **options))
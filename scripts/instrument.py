@@ -0,0 +1,92 @@
+import cProfile
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+class Recorder:
+    """Structured timing records for the encode/solve pipeline.
+
+    Every phase becomes one dict with its name, wall time and whatever counts
+    the caller attaches (clauses, variables, assertions, z3 statistics).
+    With trace_memory the peak traced memory of every phase is added as well
+    and with profile a cProfile profile of all phases is kept, dumped by
+    dump_profile.
+    """
+
+    def __init__(self, trace_memory=False, profile=False):
+        self.records = []
+        self.trace_memory = trace_memory
+        self.profiler = cProfile.Profile() if profile else None
+        self.depth = 0
+
+    def add(self, record: dict) -> None:
+        self.records.append(record)
+
+    @contextmanager
+    def phase(self, name, solver=None, encoder=None, **fields):
+        # Times the block, and counts the assertions posted to solver and the
+        # variables allocated by encoder inside it
+        record = {'phase': name, **fields}
+        assertions = len(solver.assertions()) if solver is not None else None
+        num_vars = encoder.num_vars if encoder is not None else None
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+        # Nested phases share the profiler of the outermost one
+        if self.profiler is not None and self.depth == 0:
+            self.profiler.enable()
+        self.depth += 1
+        t0 = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = time.perf_counter() - t0
+            self.depth -= 1
+            if self.profiler is not None and self.depth == 0:
+                self.profiler.disable()
+            if self.trace_memory:
+                record['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+            if solver is not None:
+                record['assertions'] = len(solver.assertions()) - assertions
+            if encoder is not None:
+                record['variables'] = encoder.num_vars - num_vars
+            self.records.append(record)
+
+    def chunks(self, name, chunks, encoder=None):
+        # Pass clause chunks through, timing only their generation (not what
+        # the consumer does with them) and counting clauses and variables.
+        # chunks may also be a function returning a single clause array.
+        if callable(chunks):
+            make = chunks
+            chunks = (make() for _ in range(1))
+        record = {'phase': name, 'seconds': 0.0, 'clauses': 0}
+        num_vars = encoder.num_vars if encoder is not None else None
+        iterator = iter(chunks)
+        while True:
+            t0 = time.perf_counter()
+            try:
+                clauses = next(iterator)
+            except StopIteration:
+                break
+            finally:
+                record['seconds'] += time.perf_counter() - t0
+            record['clauses'] += len(clauses)
+            yield clauses
+        if encoder is not None:
+            record['variables'] = encoder.num_vars - num_vars
+        self.records.append(record)
+
+    def total(self, key='seconds') -> float:
+        return sum(record.get(key, 0) for record in self.records)
+
+    def write_jsonl(self, filename: str, **fields) -> None:
+        # Append the records, each tagged with the given fields (e.g. the instance)
+        with open(filename, 'a') as file:
+            for record in self.records:
+                file.write(json.dumps({**fields, **record}) + '\n')
+
+    def dump_profile(self, filename: str) -> None:
+        if self.profiler is not None:
+            self.profiler.dump_stats(filename)
@@ -1,23 +1,119 @@
+from functools import lru_cache
+import numpy as np
+
+FIELDS = ('Z', 'F2')
+
 def flatten_index(i, j, num_cols):
     return (num_cols * i) + j
 
 def unflatten_index(i, num_rows, num_cols):
-    return ((i / num_rows), i % num_cols)
+    return (i // num_cols, i % num_cols)
+
+@lru_cache(maxsize=None)
+def mm_tensor(n: int, m: int, p: int) -> np.ndarray:
+    # Right hand sides of the Brent equations, indexed by the flattened
+    # (a, b, c) entries: T[i1*m+i2, j1*p+j2, k1*p+k2] = d(i2,j1) d(i1,k1) d(j2,k2)
+    T = np.zeros((n * m, m * p, n * p), dtype=np.int8)
+    T.reshape(-1)[mm_tensor_support(n, m, p)] = 1
+    T.setflags(write=False)
+    return T
+
+@lru_cache(maxsize=None)
+def mm_tensor_support(n: int, m: int, p: int) -> np.ndarray:
+    # Flat indices of the nmp ones of the MM tensor, everything else is 0
+    support = [np.ravel_multi_index((flatten_index(i, j, m), flatten_index(j, k, p), flatten_index(i, k, p)),
+                                    (n * m, m * p, n * p))
+               for i in range(n) for j in range(m) for k in range(p)]
+    support = np.array(support, dtype=np.int64)
+    support.setflags(write=False)
+    return support
+
+def standard_scheme(n: int, m: int, p: int) -> 'MM_Scheme':
+    # The schoolbook algorithm, one term A[i][j] B[j][k] -> C[i][k] per product
+    U = np.zeros((n * m * p, n, m), dtype=np.int8)
+    V = np.zeros((n * m * p, m, p), dtype=np.int8)
+    W = np.zeros((n * m * p, n, p), dtype=np.int8)
+    for l, (i, j, k) in enumerate((i, j, k) for i in range(n) for j in range(m) for k in range(p)):
+        U[l, i, j] = V[l, j, k] = W[l, i, k] = 1
+    return MM_Scheme(U, V, W)
 
 class MM_Scheme:
-    def __init__(self, U: list, V: list, W: list):
-        self.dimension = (len(U[0]), len(V[0]), len(U[0][0]))
-        self.rank = max([len(U), len(V), len(W)])
+    # Factor matrices are stacked per term: U[l] is the n x m alpha matrix,
+    # V[l] the m x p beta matrix and W[l] the n x p gamma matrix of term l
+    __slots__ = ('dimension', 'rank', 'U', 'V', 'W')
+
+    def __init__(self, U, V, W):
+        U, V, W = [np.asarray(X, dtype=np.int8) for X in (U, V, W)]
+        if U.ndim != 3 or V.ndim != 3 or W.ndim != 3:
+            raise ValueError('Factors must be stacks of matrices, one per term')
+        r, n, m = U.shape
+        p = V.shape[2]
+        if V.shape != (r, m, p) or W.shape != (r, n, p):
+            raise ValueError(f'Inconsistent factor shapes: {U.shape}, {V.shape}, {W.shape}')
+        self.dimension = (n, m, p)
+        self.rank = r
         self.U = U
         self.V = V
         self.W = W
 
+    def nonzero_terms(self) -> np.ndarray:
+        # Terms whose rank one tensor is not zero
+        r = self.rank
+        return np.flatnonzero(self.U.reshape(r, -1).any(axis=1) & self.V.reshape(r, -1).any(axis=1)
+                              & self.W.reshape(r, -1).any(axis=1))
+
+    def drop_zero_terms(self) -> 'MM_Scheme':
+        keep = self.nonzero_terms()
+        return MM_Scheme(self.U[keep], self.V[keep], self.W[keep])
+
+    def transpose(self) -> 'MM_Scheme':
+        # Scheme for <p, m, n> from C^T = B^T A^T
+        return MM_Scheme(self.V.transpose(0, 2, 1), self.U.transpose(0, 2, 1), self.W.transpose(0, 2, 1))
+
+    def tensor(self) -> np.ndarray:
+        # Sum of the rank one tensors, same indexing as mm_tensor
+        r = self.rank
+        return np.einsum('la,lb,lc->abc', self.U.reshape(r, -1).astype(np.int64),
+                         self.V.reshape(r, -1), self.W.reshape(r, -1))
+
+    def verify(self, field='Z') -> np.ndarray:
+        # Violated Brent equations as rows (i1, i2, j1, j2, k1, k2), empty if
+        # the scheme is valid over the given field
+        if field not in FIELDS:
+            raise ValueError(f'Invalid field: {field}')
+        n, m, p = self.dimension
+        residual = self.tensor().reshape(-1)
+        residual[mm_tensor_support(n, m, p)] -= 1
+        if field == 'F2':
+            residual %= 2
+        violated = np.flatnonzero(residual)
+        a, b, c = np.unravel_index(violated, (n * m, m * p, n * p))
+        return np.stack([a // m, a % m, b // p, b % p, c // p, c % p], axis=1)
+
+    def is_valid(self, field='Z') -> bool:
+        return len(self.verify(field)) == 0
+
+    def save(self, filename: str) -> None:
+        np.savez_compressed(filename, U=self.U, V=self.V, W=self.W)
+
+    @classmethod
+    def load(cls, filename: str) -> 'MM_Scheme':
+        with np.load(filename) as data:
+            return cls(data['U'], data['V'], data['W'])
+
+    def __eq__(self, other):
+        if not isinstance(other, MM_Scheme):
+            return NotImplemented
+        return (self.dimension == other.dimension and self.rank == other.rank
+                and np.array_equal(self.U, other.U) and np.array_equal(self.V, other.V)
+                and np.array_equal(self.W, other.W))
+
     def __str__(self):
-        result = ""
-        n = self.dimension[0]
-        m = self.dimension[1]
-        p = self.dimension[2]
-        for index in range(max([n*m, m*p, n*p])):
-            row = f"{unflatten_index(index)}:"
-            result.append(row)
-        return result
+        n, m, p = self.dimension
+        result = [f'n={n}, m={m}, p={p}, r={self.rank}']
+        for l in range(self.rank):
+            result.append(f'term {l + 1}:')
+            result.append(f'  alpha: {self.U[l].tolist()}')
+            result.append(f'  beta:  {self.V[l].tolist()}')
+            result.append(f'  gamma: {self.W[l].tolist()}')
+        return '\n'.join(result)
@@ -0,0 +1,128 @@
+import multiprocessing
+import queue
+import shutil
+import signal
+import sys
+import time
+from instance_cache import InstanceCache
+from sat_driver import solve_external
+from z3_solve import build_solver
+
+# Differently configured attempts on the same instance, run side by side. The
+# first one to answer sat or unsat wins and the others are terminated.
+# Configurations with mode 'external' run a SAT binary on the DIMACS file of
+# the F_2 encoding and are skipped when the binary is not on the PATH. All
+# attempts on the same encoding share one instance from the instance cache.
+DEFAULT_CONFIGS = [
+    {'name': 'sat', 'mode': 'sat', 'lex': False},
+    {'name': 'sat-lex', 'mode': 'sat', 'lex': True},
+    {'name': 'sat-lex-seed1', 'mode': 'sat', 'lex': True, 'seed': 1},
+    {'name': 'sat-lex-seed2', 'mode': 'sat', 'lex': True, 'seed': 2},
+    {'name': 'smt-sym-ineq', 'mode': 'smt', 'coefficients': [-1, 0, 1], 'lex': False, 'sign_sym': True,
+     'valid_ineq': True},
+    {'name': 'kissat-lex', 'mode': 'external', 'solver': 'kissat', 'lex': True},
+    {'name': 'cadical-lex', 'mode': 'external', 'solver': 'cadical', 'lex': True},
+]
+
+DEFAULT_COEFFICIENTS = {'sat': [0, 1], 'external': [0, 1], 'ternary-sat': [-1, 0, 1]}
+
+def available_configs(configs=DEFAULT_CONFIGS):
+    return [config for config in configs if config['mode'] != 'external' or shutil.which(config['solver'])]
+
+def run_external(n, m, p, r, solver, lex=False, lex_gamma=False, args=()):
+    # Solve the F_2 encoding with a DIMACS solver binary, 'sat'/'unsat'/'unknown'
+    # Workers and sweeps share the instance through the cache. The driver
+    # kills the solver's process group on the way out, so it goes down with
+    # us when the portfolio cancels this attempt.
+    def terminate(signum, frame):
+        raise SystemExit(1)
+    signal.signal(signal.SIGTERM, terminate)
+    result, _ = solve_external(n, m, p, r, solver, args, lex=lex, lex_gamma=lex_gamma)
+    return result
+
+def run_config(n, m, p, r, config):
+    mode = config['mode']
+    if mode == 'external':
+        return run_external(n, m, p, r, config['solver'], config.get('lex', False), config.get('lex_gamma', False),
+                            config.get('args', ()))
+    coefficients = config.get('coefficients', DEFAULT_COEFFICIENTS.get(mode))
+    solver = build_solver(n, m, p, r, mode, coefficients, config.get('lex', False), config.get('lex_gamma', False),
+                          config.get('sign_sym', False), config.get('valid_ineq', False),
+                          config.get('cardinality', 'totalizer'), cache=InstanceCache())
+    if 'seed' in config:
+        solver.set(random_seed=config['seed'])
+    return str(solver.check())
+
+def _worker(n, m, p, r, config, results):
+    t0 = time.time()
+    try:
+        result = run_config(n, m, p, r, config)
+    except Exception as error:
+        result = f'error: {error}'
+    results.put((config['name'], result, time.time() - t0))
+
+def run_portfolio(n, m, p, r, configs=None, timeout=None, filename='results.info'):
+    # Returns (name of the winning configuration or None, result, {name: (result, seconds)})
+    configs = available_configs() if configs is None else configs
+    results = multiprocessing.Queue()
+    workers = {config['name']: multiprocessing.Process(target=_worker, args=(n, m, p, r, config, results))
+               for config in configs}
+    t0 = time.time()
+    for worker in workers.values():
+        worker.start()
+
+    timings = {}
+    winner, result = None, 'unknown'
+    while len(timings) < len(workers):
+        remaining = None if timeout is None else timeout - (time.time() - t0)
+        if remaining is not None and remaining <= 0:
+            break
+        # Short polls, so a worker that dies without a result (killed by the
+        # OOM killer, crashed in z3, ...) cannot leave us waiting on it
+        try:
+            name, status, elapsed = results.get(timeout=1.0 if remaining is None else min(remaining, 1.0))
+        except queue.Empty:
+            pass
+        else:
+            timings[name] = (status, elapsed)
+            if status in ('sat', 'unsat'):
+                winner, result = name, status
+                break
+        for name, worker in workers.items():
+            if name not in timings and not worker.is_alive() and worker.exitcode != 0:
+                timings[name] = (f'error: worker exited with code {worker.exitcode}', time.time() - t0)
+
+    # Cancel whatever is still running
+    for name, worker in workers.items():
+        if worker.is_alive():
+            worker.terminate()
+        worker.join()
+        if name not in timings:
+            timings[name] = ('cancelled' if winner else 'timeout', time.time() - t0)
+
+    with open(filename, 'a') as file:
+        for config in configs:
+            status, elapsed = timings[config['name']]
+            coefficients = config.get('coefficients', DEFAULT_COEFFICIENTS.get(config['mode']))
+            file.write(f'Mode: portfolio {config["name"]} | Coef: {coefficients} | Dim: {n} {m} {p} {r} | '
+                       f'Time: {elapsed}s | {status}\n')
+    return winner, result, timings
+
+def main():
+    flags = [arg for arg in sys.argv[1:] if arg.startswith('--')]
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if len(args) < 4:
+        print(f'Usage : \'python3 {sys.argv[0]} dim1 dim2 dim3 rank_upper_bound [--timeout=<seconds>]\'')
+        sys.exit(1)
+    n, m, p, r = [int(x) for x in args[:4]]
+    timeout = None
+    for flag in flags:
+        if flag.startswith('--timeout='):
+            timeout = float(flag.split('=', 1)[1])
+    winner, result, timings = run_portfolio(n, m, p, r, timeout=timeout)
+    for name, (status, elapsed) in sorted(timings.items(), key=lambda item: item[1][1]):
+        print(f'{name:>16}: {status} ({elapsed:.2f} seconds)')
+    print(f'Result: {result}' + (f' ({winner})' if winner else ''))
+
+if __name__ == "__main__":
+    main()
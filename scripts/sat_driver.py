@@ -0,0 +1,117 @@
+import os
+import resource
+import signal
+import subprocess
+import sys
+import threading
+import time
+from dimacs import decode_scheme, load_sign_map, load_variable_map, read_solution, variable_map_path
+from instance_cache import InstanceCache
+
+# Driver for DIMACS SAT solver binaries (kissat, cadical, minisat or any
+# program printing 's' and 'v' lines). The solver runs in its own process
+# group under a wall clock and an address space limit, its output is parsed
+# line by line as it arrives, with 'c' lines passed on as progress, and a
+# model is decoded into a scheme through the variable map of the instance.
+# Solvers that only report through their exit code (10 sat, 20 unsat) are
+# understood too, minisat writes its model to a result file instead.
+
+STATUS = {'SATISFIABLE': 'sat', 'UNSATISFIABLE': 'unsat'}
+EXIT_STATUS = {10: 'SATISFIABLE', 20: 'UNSATISFIABLE'}
+
+def _limit_memory(megabytes):
+    def limit():
+        size = megabytes << 20
+        resource.setrlimit(resource.RLIMIT_AS, (size, size))
+    return limit
+
+def read_result_file(path):
+    # minisat's result file, 'SAT' or 'UNSAT' then the model on one line
+    with open(path) as file:
+        status = file.readline().strip()
+        lines = [f'v {line}' for line in file]
+    _, assignment = read_solution(lines)
+    return {'SAT': 'SATISFIABLE', 'UNSAT': 'UNSATISFIABLE'}.get(status), assignment
+
+def run_solver(path, solver='kissat', args=(), timeout=None, memory=None, progress=None):
+    # (status line of the solver or None, bool assignment indexed by variable
+    # id) for a DIMACS file. timeout is in seconds and memory in megabytes,
+    # progress is called with the text of every comment line.
+    command = [solver, *args, path]
+    result_file = None
+    if os.path.basename(solver).startswith('minisat'):
+        result_file = f'{path}.{os.getpid()}.result'
+        command.append(result_file)
+    proc = subprocess.Popen(command, stdout=subprocess.PIPE, text=True, bufsize=1, start_new_session=True,
+                            preexec_fn=_limit_memory(memory) if memory else None)
+    def kill():
+        # Take the solver down with anything it started
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    timer = threading.Timer(timeout, kill) if timeout else None
+    if timer is not None:
+        timer.start()
+    try:
+        status, assignment = read_solution(proc.stdout, comment=progress)
+        code = proc.wait()
+    finally:
+        if timer is not None:
+            timer.cancel()
+        if proc.poll() is None:
+            kill()
+            proc.wait()
+    if result_file is not None and os.path.exists(result_file):
+        status, assignment = read_result_file(result_file)
+        os.remove(result_file)
+    return status or EXIT_STATUS.get(code), assignment
+
+def solve_instance(path, solver='kissat', args=(), timeout=None, memory=None, progress=None):
+    # ('sat', scheme), ('unsat', None) or ('unknown', None) for a DIMACS file
+    # written with its variable map sidecar
+    status, assignment = run_solver(path, solver, args, timeout, memory, progress)
+    result = STATUS.get(status, 'unknown')
+    if result != 'sat':
+        return result, None
+    if not assignment.any():
+        raise RuntimeError(f'{solver} reported sat without a model')
+    alpha, beta, gamma = load_variable_map(variable_map_path(path))
+    signs = load_sign_map(variable_map_path(path))
+    return result, decode_scheme(assignment, alpha, beta, gamma, signs)
+
+def solve_external(n, m, p, r, solver='kissat', args=(), timeout=None, memory=None, progress=None, **options):
+    # solve_instance on the cached instance, options are those of the cache
+    path = InstanceCache().instance(n, m, p, r, **options)
+    return solve_instance(path, solver, args, timeout, memory, progress)
+
+def main():
+    flags = dict((arg[2:].split('=', 1) + [None])[:2] for arg in sys.argv[1:] if arg.startswith('--'))
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if len(args) < 4:
+        print(f'Usage : \'python3 {sys.argv[0]} dim1 dim2 dim3 rank [--solver=kissat] [--timeout=<seconds>] '
+              f'[--memory=<megabytes>] [--ternary] [--lex] [--lex-gamma] [--valid-ineq] [--quiet] [--out=<dir>]\'')
+        sys.exit(1)
+    n, m, p, r = [int(x) for x in args[:4]]
+    solver = flags.get('solver') or 'kissat'
+    t0 = time.time()
+    def progress(text):
+        print(f'[{time.time() - t0:8.1f}s] {text}')
+    result, scheme = solve_external(n, m, p, r, solver, (), float(flags['timeout']) if flags.get('timeout') else None,
+                                    int(flags['memory']) if flags.get('memory') else None,
+                                    None if 'quiet' in flags else progress, ternary='ternary' in flags,
+                                    lex='lex' in flags, lex_gamma='lex-gamma' in flags,
+                                    valid_ineq='valid-ineq' in flags)
+    print(f'Result: {result} ({time.time() - t0:.1f} seconds)')
+    with open('results.info', 'a') as file:
+        file.writelines([f'Mode: external {solver} | Dim: {n} {m} {p} {r} | Time: {time.time() - t0}s | {result}\n'])
+    if scheme is not None:
+        field = 'Z' if 'ternary' in flags else 'F2'
+        if not scheme.is_valid(field):
+            raise RuntimeError(f'{solver} returned an invalid scheme')
+        out = flags.get('out') or 'schemes'
+        os.makedirs(out, exist_ok=True)
+        scheme.save(os.path.join(out, f'{n}{m}{p}_r{scheme.rank}.npz'))
+
+if __name__ == "__main__":
+    main()
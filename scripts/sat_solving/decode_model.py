@@ -0,0 +1,34 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from dimacs import read_solution, load_variable_map, load_sign_map, variable_map_path, decode_scheme
+
+# Turn the output of a DIMACS solver (e.g. 'kissat file.cnf > file.out')
+# back into the coefficients of the scheme, using the file's .vars.npz map
+
+def main():
+    if len(sys.argv) < 3:
+        print(f'Usage : \'python3 {sys.argv[0]} file.cnf solver_output [scheme.npz]\'')
+        sys.exit(1)
+    cnf_filename, output_filename = sys.argv[1:3]
+    t0 = time.time()
+    alpha, beta, gamma = load_variable_map(variable_map_path(cnf_filename))
+    signs = load_sign_map(variable_map_path(cnf_filename))
+    with open(output_filename) as file:
+        status, assignment = read_solution(file)
+    print(f'Status: {status}')
+    if status != 'SATISFIABLE':
+        return
+    scheme = decode_scheme(assignment, alpha, beta, gamma, signs)
+    print(f'Decoded in {time.time() - t0:.4f}s')
+    print(scheme)
+    field = 'F2' if signs is None else 'Z'
+    violated = scheme.verify(field=field)
+    print(f'Valid over {field}: {len(violated) == 0} ({len(violated)} violated equations)')
+    if len(sys.argv) > 3:
+        scheme.save(sys.argv[3])
+
+if __name__ == "__main__":
+    main()
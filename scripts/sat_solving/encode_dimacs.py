@@ -0,0 +1,62 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from instance_cache import InstanceCache, write_instance
+from instrument import Recorder
+
+# Single pass replacement for get_unformatted_cnf.py + unformatted_to_dimacs.py,
+# clauses are written one equation at a time as they are encoded
+
+def encode_dimacs(n, m, p, r, filename=None, lex=False, lex_gamma=False, valid_ineq=False, cardinality='totalizer',
+                  ternary=False, sign_sym=False, cyclic=None, recorder=None):
+    if filename is None:
+        filename = f'cnf_files/rank_{n}{m}{p}_leq_{r}.cnf'
+    counts = write_instance(filename, n, m, p, r, lex=lex, lex_gamma=lex_gamma, valid_ineq=valid_ineq,
+                            cardinality=cardinality, ternary=ternary, sign_sym=sign_sym, cyclic=cyclic,
+                            recorder=recorder)
+    return filename, counts
+
+def main():
+    flags = [arg for arg in sys.argv[1:] if arg.startswith('--')]
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if len(args) < 4:
+        print(f'Usage : \'python3 {sys.argv[0]} dim1 dim2 dim3 rank_upper_bound [output.cnf] [--lex] [--lex-gamma] [--valid-ineq] [--cardinality=<encoding>] [--ternary] [--sign-sym] [--cyclic[=<fixed terms>]] [--cache[=<dir>]] [--stats=<file.jsonl>] [--profile=<file.prof>] [--trace-memory]\'')
+        sys.exit(1)
+    n, m, p, r = [int(x) for x in args[:4]]
+    filename = args[4] if len(args) > 4 else None
+    cardinality = 'totalizer'
+    cyclic = None
+    for flag in flags:
+        if flag.startswith('--cardinality='):
+            cardinality = flag.split('=', 1)[1]
+        if flag == '--cyclic' or flag.startswith('--cyclic='):
+            # As few fixed terms as the rank allows unless given
+            cyclic = int(flag.split('=', 1)[1]) if '=' in flag else r % 3
+    options = dict(lex='--lex' in flags or '--lex-gamma' in flags, lex_gamma='--lex-gamma' in flags,
+                   valid_ineq='--valid-ineq' in flags, cardinality=cardinality,
+                   ternary='--ternary' in flags, sign_sym='--sign-sym' in flags, cyclic=cyclic)
+    t0 = time.time()
+    cache = [flag for flag in flags if flag == '--cache' or flag.startswith('--cache=')]
+    if cache:
+        # Look the instance up in (or add it to) the cache and print its path
+        cache = InstanceCache(cache[0].split('=', 1)[1]) if '=' in cache[0] else InstanceCache()
+        filename = cache.instance(n, m, p, r, **options)
+        print(f'{filename} ({time.time() - t0:.2f}s)')
+        return
+    stats = [flag.split('=', 1)[1] for flag in flags if flag.startswith('--stats=')]
+    profile = [flag.split('=', 1)[1] for flag in flags if flag.startswith('--profile=')]
+    recorder = Recorder(trace_memory='--trace-memory' in flags, profile=bool(profile))
+    filename, (num_vars, num_clauses) = encode_dimacs(n, m, p, r, filename, recorder=recorder, **options)
+    print(f'Wrote {filename}: {num_vars} variables, {num_clauses} clauses in {time.time() - t0:.2f}s')
+    for record in recorder.records:
+        print(f'  {record["phase"]:>18}: {record["seconds"]:.3f}s, {record.get("clauses", 0)} clauses, '
+              f'{record.get("variables", 0)} variables')
+    if stats:
+        recorder.write_jsonl(stats[0], dimension=[n, m, p], rank=r, **options)
+    if profile:
+        recorder.dump_profile(profile[0])
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,13 @@
+import os
+import sys
 import time
 from datetime import datetime
 from z3 import *
-from functools import reduce
-from itertools import combinations
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from brent_cnf import BrentEncoder
+from z3_solve import add_cnf
+from cardinality import at_least_k
 
 now = datetime.now()
 output_per_line = 7
@@ -25,110 +30,14 @@ def kron(i: int, j: int) -> int:
     else:
         return 0
     
-def is_atom(t):
-    if not is_bool(t):
-        return False
-    if not is_app(t):
-        return False
-    k = t.decl().kind()
-    if k == Z3_OP_AND or k == Z3_OP_OR or k == Z3_OP_IMPLIES:
-        return False
-    if k == Z3_OP_EQ and t.arg(0).is_bool():
-        return False
-    if k == Z3_OP_TRUE or k == Z3_OP_FALSE or k == Z3_OP_XOR or k == Z3_OP_NOT:
-        return False
-    return True
-
-def atoms(fml):
-    visited = set([])
-    atms = set([])
-    def atoms_rec(t, visited, atms):
-        if t in visited:
-            return
-        visited |= { t }
-        if is_atom(t):
-            atms |= { t }
-        for s in t.children():
-            atoms_rec(s, visited, atms)
-    atoms_rec(fml, visited, atms)
-    return atms
-
-def atom2literal(m, a):
-    if is_true(m.eval(a)):
-        return a
-    return Not(a)
-    
-def implicant(atoms, s, snot):
-    m = snot.model()
-    lits = [atom2literal(m, a) for a in atoms]
-    is_sat = s.check(lits)
-    assert is_sat == unsat
-    core = s.unsat_core()
-    return Or([mk_not(c) for c in core])
-
-
-def to_cnf(fml):
-    atms = atoms(fml)
-    s = Solver()
-    snot = Solver()
-    snot.add(Not(fml))
-    s.add(fml)
-
-    while sat == snot.check():
-        clause = implicant(atms, s, snot)
-        yield clause
-        snot.add(clause)
-
-def apply_tseitin(expr):
-    tseitin_cnf = Tactic('tseitin-cnf')
-    return tseitin_cnf(expr)
-
-def get_sublists(lst, n):
-    N = len(lst)
-    result = []
-    num_dels = N - n
-    if num_dels < 0:
-        return []
-    del_combs = list(combinations(range(N), num_dels))
-    for del_idxs in del_combs:
-        sblst = [lst[i] for i in range(N) if i not in del_idxs]
-        result.append(sblst)
-    return result
-
-def add_counting_clauses(vars, thresh):
-    valid_combns = get_sublists(vars, thresh)
-    for sublist in valid_combns:
-        formula = And(sublist)
-        print(formula)
-        cnf = apply_tseitin(formula)
-        print(cnf)
-        for clause in cnf:
-            all_clauses.append(clause)
-            solver.add(clause)
+def add_counting_clauses(vars, thresh, encoding='totalizer'):
+    # At least thresh of vars are true, vars are names of the variables
+    ids = [name_to_id[name] for name in vars]
+    add_cnf(solver, at_least_k(ids, thresh, encoder.new_vars, encoding), literals)
 
 def add_lexicographic_constraint():
-    for l in range(r-1):
-        vector_l = []
-        vector_l_plus_one = []
-        for i1, i2 in nm_pairs:
-            vector_l.append(variables[f'α{i1+1}{i2+1}^{l+1}'])
-            vector_l_plus_one.append(variables[f'α{i1+1}{i2+1}^{l+2}'])
-        for j1, j2 in mp_pairs:
-            vector_l.append(variables[f'β{j1+1}{j2+1}^{l+1}'])
-            vector_l_plus_one.append(variables[f'β{j1+1}{j2+1}^{l+2}'])
-        lex_constraint = in_order(vector_l, vector_l_plus_one)
-        solver.add(lex_constraint)
-
-# Input: two vectors of variables
-def in_order(vectorA, vectorB):
-    # If vectorA is empty we are definitely in_order
-    if not vectorA:
-        return True
-    # If vectorB is empty while vectorA is not we are definitely **NOT** in_order
-    if not vectorB:
-        return False
-    # If neither are empty, compare the first elements and recurse
-    return Or(vectorA[0] < vectorB[0], And(vectorA[0] == vectorB[0], in_order(vectorA[1:], vectorB[1:])))
+    # Linear size lex-leader clauses over the alpha and beta entries
+    add_cnf(solver, encoder.lex_clauses(), literals)
 
 plog('Field : F_2')
 
@@ -193,39 +102,17 @@ for idx in range(1, r + 1):
 log('variables initialized!')
 # log(var_names)
 
-all_clauses = []
-
-# Create and add boolean formula for each of the equations
-for i1 in range(1, n + 1):
-    for i2 in range(1, m + 1):
-        for j1 in range(1, m + 1):
-            for j2 in range(1, p + 1):
-                for k1 in range(1, n + 1):
-                    for k2 in range(1, p + 1):
-                        log('i1: {}, i2: {}, j1: {}, j2: {}, k1: {}, k2: {}'.format(i1,i2,j1,j2,k1,k2))
-
-                        # Generate expression
-                        and_exprs = []
-                        for idx in range(1, r + 1):
-                            and_exprs.append(And(variables['α{}{}^{}'.format(i1, i2, idx)],
-                                variables['β{}{}^{}'.format(j1, j2, idx)],
-                                variables['γ{}{}^{}'.format(k1, k2, idx)]))
-
-                        # XOR over all the and expressions
-                        lhs = reduce(lambda x, y: Xor(x, y), and_exprs)
-                        
-                        # Do the product of kronecker deltas
-                        rhs = kron(i2,j1)*kron(i1,k1)*kron(j2,k2)
-                        log('lhs: {}, rhs: {}'.format(lhs,rhs))
-                        formula = lhs
-                        if rhs == 0:
-                            formula = Not(lhs)
-                        goal = Goal()
-                        goal.add(formula)
-                        formula_cnf = apply_tseitin(formula)
-                        for clause in formula_cnf:
-                            all_clauses.append(clause)
-                            solver.add(clause)
+# Create and add the clauses for each of the equations, the integer encoder
+# produces the Tseitin clauses directly instead of one tactic call per equation
+encoder = BrentEncoder(n, m, p, r)
+literals = [None] * (encoder.num_primary + 1)
+name_to_id = {}
+for var, name in encoder.variable_names('αβγ', offset=1).items():
+    literals[var] = variables[name]
+    name_to_id[name] = var
+for clauses in encoder.clauses():
+    log(f'{len(clauses)} clauses')
+    add_cnf(solver, clauses, literals)
 
 add_lexicographic_constraint()
 
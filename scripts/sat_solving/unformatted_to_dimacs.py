@@ -1,6 +1,10 @@
+import os
 import sys
-import hashlib
 import re
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from dimacs import save_variable_map, variable_map_path
 
 def delete_lines_starting_with_declare_in_string(input_text):
     # Split the input text into lines
@@ -33,7 +37,7 @@ def convert_unformatted_file(filename):
     input_text = input_file.read()
 
     print('converting to dimacs...')
-    output_text = to_dimacs(input_text)
+    output_text, word_to_integer = to_dimacs(input_text)
 
     # Create output file with fixed name
     print('creating output file...')
@@ -44,6 +48,27 @@ def convert_unformatted_file(filename):
     output_file = open(output_filename, 'w')
     output_file.write(output_text)
 
+    # Keep the variable numbering so solver models can be decoded later
+    print('writing variable map...')
+    write_variable_map(variable_map_path(output_filename), word_to_integer)
+
+def write_variable_map(filename, word_to_integer):
+    # Coefficient names look like α12^3 (1-based), quoted as |α12^3| in sexprs
+    pattern = re.compile(r'^\|?([αβγ])(\d)(\d)\^(\d+)\|?$')
+    entries = []
+    for word, integer in word_to_integer.items():
+        match = pattern.match(word)
+        if match:
+            factor, row, col, term = match.groups()
+            entries.append(('αβγ'.index(factor), int(row) - 1, int(col) - 1, int(term) - 1, integer))
+    entries = np.array(entries, dtype=np.int64).reshape(-1, 5)
+    r = entries[:, 3].max() + 1
+    shapes = [entries[entries[:, 0] == f][:, 1:3].max(axis=0) + 1 for f in range(3)]
+    maps = [np.zeros((r, rows, cols), dtype=np.int32) for rows, cols in shapes]
+    for factor, row, col, term, integer in entries:
+        maps[factor][term, row, col] = integer
+    save_variable_map(filename, *maps)
+
 
 def to_dimacs(text):
     # Create result text
@@ -58,13 +83,16 @@ def to_dimacs(text):
     result = result.replace('not', '-')
 
     # Give variables integers
-    result = replace_words_with_integers_preserve_lines(result)
+    result, word_to_integer = replace_words_with_integers_preserve_lines(result)
     result = result.replace('- ', '-')
     num_clauses = len(result.splitlines())
 
+    # Not every variable is declared (e.g. the gates the tactic introduces)
+    num_vars = max(num_vars, len(word_to_integer))
+
     result = f'p cnf {num_vars} {num_clauses}\n' + result
 
-    return result
+    return result, word_to_integer
 
 def replace_words_with_integers_preserve_lines(text):
     # Split the line into words
@@ -91,6 +119,6 @@ def replace_words_with_integers_preserve_lines(text):
             result.append(str(word_to_integer[word]))
     
     # Reassemble the line
-    return ' '.join(result)
+    return ' '.join(result), word_to_integer
 
 convert_unformatted_file(sys.argv[1])
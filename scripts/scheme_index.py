@@ -0,0 +1,254 @@
+import hashlib
+import itertools
+import json
+import re
+import sqlite3
+import sys
+import numpy as np
+from gf2_linalg import pack_rows, row_reduce
+from mm_scheme import FIELDS, MM_Scheme
+
+# Deduplication of schemes under the symmetries of the MM tensor: permuting
+# terms, (a, b, c) -> (-a, -b, c) and (a, -b, -c) sign changes of a term, the
+# sandwiching (U, V, W) -> (P U Q, Q^-1 V R, P^-T W R^-T), transposition when
+# n = p and the cyclic shift when n = m = p. The invariants (rank triples of
+# the terms and ranks of the stacked factors) are cheap and never separate
+# equivalent schemes. The canonical representative is the smallest variant
+# over the group of term permutations, signs, transposition and cyclic shift
+# and of a finite sandwiching group: GL over F_2, signed permutation
+# matrices over Z, shrunk to plain permutations when the group would exceed
+# max_group elements. Schemes that are only equivalent through a sandwich
+# outside that group keep separate representatives, but share invariants.
+
+DEFAULT_MAX_GROUP = 20000
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS schemes (
+    key TEXT PRIMARY KEY,
+    invariants TEXT,
+    n INTEGER, m INTEGER, p INTEGER, r INTEGER,
+    field TEXT,
+    U BLOB, V BLOB, W BLOB,
+    source TEXT
+)
+'''
+
+def rank(X, field) -> int:
+    if field == 'F2':
+        return len(row_reduce(pack_rows(np.asarray(X) % 2), X.shape[1])[0])
+    return int(np.linalg.matrix_rank(np.asarray(X, dtype=np.float64)))
+
+def reduce(scheme: MM_Scheme, field) -> MM_Scheme:
+    # Coefficients in the field (F_2 as 0/1) and zero terms dropped
+    if field not in FIELDS:
+        raise ValueError(f'Invalid field: {field}')
+    if field == 'F2':
+        scheme = MM_Scheme(scheme.U % 2, scheme.V % 2, scheme.W % 2)
+    return scheme.drop_zero_terms()
+
+def variants(scheme: MM_Scheme) -> list:
+    # The scheme and its images under transposition and the cyclic shift,
+    # those that keep the dimension
+    n, m, p = scheme.dimension
+    result = [scheme]
+    if n == p:
+        result.append(scheme.transpose())
+    if n == m == p:
+        for X in list(result):
+            for _ in range(2):
+                X = MM_Scheme(X.V, X.W.transpose(0, 2, 1), X.U.transpose(0, 2, 1))
+                result.append(X)
+    return result
+
+def invariants(scheme: MM_Scheme, field='Z') -> tuple:
+    # (rank triple histogram, stacked factor ranks) minimized over variants
+    scheme = reduce(scheme, field)
+    r = scheme.rank
+    best = None
+    for X in variants(scheme):
+        triples = sorted((rank(U, field), rank(V, field), rank(W, field)) for U, V, W in zip(X.U, X.V, X.W))
+        stacked = tuple(rank(F.reshape(r, -1), field) for F in (X.U, X.V, X.W))
+        value = (tuple(triples), stacked)
+        best = value if best is None or value < best else best
+    return best
+
+def invertible_matrices(k: int, field) -> np.ndarray:
+    # GL(k, F_2) for F_2, signed permutation matrices for Z
+    if field == 'F2':
+        bits = ((np.arange(2**(k * k))[:, None] >> np.arange(k * k)) & 1).reshape(-1, k, k)
+        return np.stack([X for X in bits if rank(X, 'F2') == k]).astype(np.int64)
+    matrices = []
+    for perm in itertools.permutations(range(k)):
+        for signs in itertools.product((1, -1), repeat=k):
+            X = np.zeros((k, k), dtype=np.int64)
+            X[np.arange(k), perm] = signs
+            matrices.append(X)
+    return np.stack(matrices)
+
+def permutation_matrices(k: int) -> np.ndarray:
+    return np.stack([np.eye(k, dtype=np.int64)[list(perm)] for perm in itertools.permutations(range(k))])
+
+def inverses(X, field) -> np.ndarray:
+    # Inverse of every matrix of a group
+    if field == 'Z':
+        # Signed permutation matrices are orthogonal
+        return X.transpose(0, 2, 1)
+    k = X.shape[1]
+    products = np.einsum('aij,bjk->abik', X, X) % 2
+    return X[np.all(products == np.eye(k, dtype=np.int64), axis=(2, 3)).argmax(axis=1)]
+
+def sandwich_group(dimension, field, max_group=DEFAULT_MAX_GROUP) -> list:
+    # (P, Q, R) stacks, every combination is one group element
+    groups = [invertible_matrices(k, field) for k in dimension]
+    if np.prod([len(g) for g in groups]) > max_group:
+        groups = [permutation_matrices(k) for k in dimension]
+    if np.prod([len(g) for g in groups]) > max_group:
+        groups = [np.eye(k, dtype=np.int64)[None] for k in dimension]
+    return groups
+
+def normalize_signs(U, V, W):
+    # (a, b, c) ~ (-a, -b, c) ~ (a, -b, -c): the first nonzero entries of
+    # a and c are made positive, on (..., r, rows, cols) stacks
+    def first_sign(X):
+        flat = X.reshape(X.shape[:-2] + (-1,))
+        first = np.take_along_axis(flat, (flat != 0).argmax(axis=-1)[..., None], axis=-1)[..., 0]
+        return np.where(first < 0, -1, 1)[..., None, None]
+    s, t = first_sign(U), first_sign(W)
+    return U * s, V * s * t, W * t
+
+def images(scheme: MM_Scheme, field='Z', max_group=DEFAULT_MAX_GROUP):
+    # Yields (group elements, terms, entries) int8 stacks of the reduced
+    # scheme's images, one stack per variant, with every term as its alpha,
+    # beta and gamma entries and signs normalized over Z
+    scheme = reduce(scheme, field)
+    P, Q, R = sandwich_group(scheme.dimension, field, max_group)
+    Q_inv, P_inv_T, R_inv_T = inverses(Q, field), inverses(P, field).transpose(0, 2, 1), \
+        inverses(R, field).transpose(0, 2, 1)
+    for X in variants(scheme):
+        U = np.einsum('aij,ljk,bkm->ablim', P, X.U.astype(np.int64), Q)
+        V = np.einsum('bij,ljk,ckm->bclim', Q_inv, X.V.astype(np.int64), R)
+        W = np.einsum('aij,ljk,ckm->aclim', P_inv_T, X.W.astype(np.int64), R_inv_T)
+        # Broadcast to one axis per group element: (P, Q, R, term, rows, cols)
+        U = np.broadcast_to(U[:, :, None], (len(P), len(Q), len(R)) + U.shape[2:])
+        V = np.broadcast_to(V[None], (len(P),) + V.shape)
+        W = np.broadcast_to(W[:, None], (len(P), len(Q)) + W.shape[1:])
+        if field == 'F2':
+            U, V, W = U % 2, V % 2, W % 2
+        else:
+            U, V, W = normalize_signs(U, V, W)
+        terms = np.concatenate([F.reshape(F.shape[:4] + (-1,)) for F in (U, V, W)], axis=-1).astype(np.int8)
+        yield terms.reshape((-1,) + terms.shape[3:])
+
+def split_terms(rows, dimension) -> MM_Scheme:
+    # Inverse of the term rows of images
+    n, m, p = dimension
+    rows = np.asarray(rows).reshape(len(rows), -1)
+    U, V, W = np.split(rows, [n * m, n * m + m * p], axis=1)
+    return MM_Scheme(U.reshape(-1, n, m), V.reshape(-1, m, p), W.reshape(-1, n, p))
+
+def orbit(scheme: MM_Scheme, field='Z', max_group=DEFAULT_MAX_GROUP) -> list:
+    # The distinct images of the scheme, terms sorted
+    seen = {}
+    for terms in images(scheme, field, max_group):
+        for candidate in terms:
+            rows = sorted(row.tobytes() for row in candidate)
+            seen.setdefault(b''.join(rows), rows)
+    return [split_terms(np.frombuffer(b''.join(rows), dtype=np.int8).reshape(len(rows), -1), scheme.dimension)
+            for rows in seen.values()]
+
+def canonical_form(scheme: MM_Scheme, field='Z', max_group=DEFAULT_MAX_GROUP) -> MM_Scheme:
+    # The smallest image with its terms sorted, compared as int8 bytes
+    best, best_key = None, None
+    for terms in images(scheme, field, max_group):
+        for candidate in terms:
+            key = b''.join(sorted(row.tobytes() for row in candidate))
+            if best_key is None or key < best_key:
+                best_key, best = key, candidate
+    return split_terms(sorted(best, key=lambda row: row.tobytes()), scheme.dimension)
+
+def scheme_key(canonical: MM_Scheme, field) -> str:
+    data = json.dumps([list(canonical.dimension), field]).encode()
+    data += b''.join(X.tobytes() for X in (canonical.U, canonical.V, canonical.W))
+    return hashlib.sha256(data).hexdigest()
+
+def parse_solution(text: str) -> MM_Scheme:
+    # Schemes written as 'n=2, m=2, p=2, r=7' followed by 'α11^1: 1, ...'
+    # entries with 1-based indices, as in backup/solution.txt
+    n, m, p, r = [int(x) for x in re.search(r'n=(\d+), m=(\d+), p=(\d+), r=(\d+)', text).groups()]
+    factors = {'α': np.zeros((r, n, m), dtype=np.int8), 'β': np.zeros((r, m, p), dtype=np.int8),
+               'γ': np.zeros((r, n, p), dtype=np.int8)}
+    for symbol, i, j, l, value in re.findall(r'([αβγ])(\d)(\d)\^(\d+): (-?\d+)', text):
+        factors[symbol][int(l) - 1, int(i) - 1, int(j) - 1] = int(value)
+    return MM_Scheme(factors['α'], factors['β'], factors['γ'])
+
+class SchemeIndex:
+    """Canonical representatives in a SQLite table keyed by the hash of the
+    representative, so membership is one primary key lookup. Schemes with
+    equal invariants but different keys can be listed with candidates().
+    """
+
+    def __init__(self, path='schemes.db', field='Z', max_group=DEFAULT_MAX_GROUP):
+        self.field = field
+        self.max_group = max_group
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(SCHEMA)
+        self.connection.execute('CREATE INDEX IF NOT EXISTS by_invariants ON schemes (invariants)')
+
+    def key(self, scheme: MM_Scheme):
+        canonical = canonical_form(scheme, self.field, self.max_group)
+        return scheme_key(canonical, self.field), canonical
+
+    def __contains__(self, scheme: MM_Scheme) -> bool:
+        key, _ = self.key(scheme)
+        return self.connection.execute('SELECT 1 FROM schemes WHERE key = ?', (key,)).fetchone() is not None
+
+    def add(self, scheme: MM_Scheme, source=None):
+        # (key, True) for a new scheme, (key, False) for a duplicate
+        key, canonical = self.key(scheme)
+        n, m, p = canonical.dimension
+        cursor = self.connection.execute(
+            'INSERT OR IGNORE INTO schemes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (key, json.dumps(invariants(canonical, self.field)), n, m, p, canonical.rank, self.field,
+             canonical.U.tobytes(), canonical.V.tobytes(), canonical.W.tobytes(), source))
+        self.connection.commit()
+        return key, cursor.rowcount == 1
+
+    def get(self, key: str):
+        row = self.connection.execute('SELECT n, m, p, r, U, V, W FROM schemes WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        n, m, p, r, U, V, W = row
+        return MM_Scheme(*[np.frombuffer(X, dtype=np.int8).reshape(shape)
+                           for X, shape in ((U, (r, n, m)), (V, (r, m, p)), (W, (r, n, p)))])
+
+    def candidates(self, scheme: MM_Scheme) -> list:
+        # Keys of stored schemes with the same invariants
+        value = json.dumps(invariants(scheme, self.field))
+        return [row[0] for row in self.connection.execute('SELECT key FROM schemes WHERE invariants = ?', (value,))]
+
+    def __len__(self) -> int:
+        return self.connection.execute('SELECT COUNT(*) FROM schemes').fetchone()[0]
+
+    def close(self) -> None:
+        self.connection.close()
+
+def main():
+    flags = dict(arg[2:].split('=', 1) for arg in sys.argv[1:] if arg.startswith('--') and '=' in arg)
+    files = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if not files:
+        print(f'Usage : \'python3 {sys.argv[0]} scheme.npz|solution.txt ... [--index=schemes.db] [--field=Z|F2]\'')
+        sys.exit(1)
+    index = SchemeIndex(flags.get('index', 'schemes.db'), flags.get('field', 'Z'))
+    for filename in files:
+        if filename.endswith('.npz'):
+            scheme = MM_Scheme.load(filename)
+        else:
+            with open(filename) as file:
+                scheme = parse_solution(file.read())
+        key, new = index.add(scheme, filename)
+        print(f'{filename}: {key[:16]} {"new" if new else "duplicate"}')
+    print(f'{len(index)} schemes in the index')
+    index.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import numpy as np
+from brent_cnf import BrentEncoder, stack_clauses
+from cardinality import clause_array, exactly_k, valid_inequality_clauses
+from mm_scheme import MM_Scheme
+
+class TernaryEncoder(BrentEncoder):
+    """Brent equations over Z with coefficients in {-1, 0, 1} as pure CNF.
+
+    Every coefficient x is a pair of variables: nonzero (x != 0) and negative
+    (x == -1, only allowed when nonzero). alpha/beta/gamma hold the nonzero
+    ids and alpha_neg/beta_neg/gamma_neg the negative ids.
+    """
+
+    def __init__(self, n: int, m: int, p: int, r: int, cardinality='totalizer', cyclic=None):
+        super().__init__(n, m, p, r, cyclic)
+        self.cardinality = cardinality
+        size = self.num_primary
+        self.alpha_neg = self.alpha + size
+        self.beta_neg = self.beta + size
+        self.gamma_neg = self.gamma + size
+        self.num_primary = 2 * size
+        # Products and sums are encoded with circuits whose size depends on
+        # the right hand side, so auxiliaries are allocated as they are needed
+        self.aux_per_equation = None
+        self.clauses_per_equation = None
+        self.num_vars = self.num_primary
+
+    def variable_names(self, symbols='abc', offset=0) -> dict:
+        names = {}
+        for var, name in super().variable_names(symbols, offset).items():
+            names[var] = f'{name}_nz'
+            names[var + self.num_primary // 2] = f'{name}_neg'
+        return names
+
+    def term_vector(self, l: int, include_gamma=False) -> np.ndarray:
+        nonzero = super().term_vector(l, include_gamma)
+        return np.concatenate([nonzero, nonzero + self.num_primary // 2])
+
+    def term_variables(self, l: int) -> np.ndarray:
+        nonzero = super().term_variables(l)
+        return np.concatenate([nonzero, nonzero + self.num_primary // 2])
+
+    def coefficient_values(self, var: int, coefficient: int) -> list:
+        if coefficient not in (-1, 0, 1):
+            raise ValueError(f'Coefficient {coefficient} is not in {{-1, 0, 1}}')
+        return [(var, coefficient != 0), (var + self.num_primary // 2, coefficient < 0)]
+
+    def coefficient_clauses(self) -> np.ndarray:
+        # A zero coefficient is never negative, so each value has one encoding
+        nonzero = np.arange(1, self.num_primary // 2 + 1, dtype=np.int32)
+        negative = nonzero + self.num_primary // 2
+        return clause_array(np.stack([-negative, nonzero], axis=1).tolist())
+
+    def equation_clauses(self, positions) -> np.ndarray:
+        positions = np.atleast_1d(np.asarray(positions, dtype=np.int64))
+        E, r = len(positions), self.r
+        eq = self.equations[positions]
+        a_idx, b_idx, c_idx = np.unravel_index(eq, (self.n * self.m, self.m * self.p, self.n * self.p))
+        za = self.alpha.reshape(r, -1)[:, a_idx].T
+        zb = self.beta.reshape(r, -1)[:, b_idx].T
+        zc = self.gamma.reshape(r, -1)[:, c_idx].T
+        sa = self.alpha_neg.reshape(r, -1)[:, a_idx].T
+        sb = self.beta_neg.reshape(r, -1)[:, b_idx].T
+        sc = self.gamma_neg.reshape(r, -1)[:, c_idx].T
+
+        t, q, pos, neg = self.new_vars(4 * E * r).reshape(4, E, r)
+        rows = []
+        # t <-> za & zb & zc, the product is nonzero
+        rows += [np.stack([-t, za], axis=-1), np.stack([-t, zb], axis=-1), np.stack([-t, zc], axis=-1),
+                 np.stack([t, -za, -zb, -zc], axis=-1)]
+        # q <-> sa ^ sb ^ sc, the sign of the product
+        for x in (1, -1):
+            for y in (1, -1):
+                for w in (1, -1):
+                    parity = (x < 0) ^ (y < 0) ^ (w < 0)
+                    rows.append(np.stack([x * sa, y * sb, w * sc, q if parity else -q], axis=-1))
+        # pos <-> t & -q and neg <-> t & q, the product is +1 or -1
+        rows += [np.stack([-pos, t], axis=-1), np.stack([-pos, -q], axis=-1), np.stack([pos, -t, q], axis=-1),
+                 np.stack([-neg, t], axis=-1), np.stack([-neg, q], axis=-1), np.stack([neg, -t, -q], axis=-1)]
+        clauses = [stack_clauses([block.reshape(-1, block.shape[-1]) for block in rows])]
+
+        # #pos - #neg == rhs is a cardinality constraint: exactly rhs + r of
+        # the pos literals and the negated neg literals are true, one
+        # counting network per equation with its output fixed
+        for e, k in enumerate((self.rhs[eq] + r).tolist()):
+            lits = np.concatenate([pos[e], -neg[e]])
+            clauses.append(exactly_k(lits, k, self.new_vars, self.cardinality))
+        return stack_clauses(clauses)
+
+    def clauses(self, chunk_size=64):
+        yield self.coefficient_clauses()
+        yield from super().clauses(chunk_size)
+
+    def sign_symmetry_clauses(self) -> np.ndarray:
+        # (a, b, c) -> (-a, -b, c) and (a, b, c) -> (a, -b, -c) leave a term
+        # unchanged, so the first nonzero alpha and gamma entries are -1.
+        # seen[q] may only hold if one of the entries before q is nonzero.
+        # Under the cyclic ansatz the terms of an orbit share their signs, so
+        # normalizing every term on its own would exclude valid schemes.
+        if self.cyclic is not None:
+            raise ValueError('Sign symmetries are not compatible with the cyclic ansatz')
+        rows = []
+        for nonzero, negative in ((self.alpha, self.alpha_neg), (self.gamma, self.gamma_neg)):
+            for z, s in zip(nonzero.reshape(self.r, -1).tolist(), negative.reshape(self.r, -1).tolist()):
+                seen = [0] + self.new_vars(len(z) - 1).tolist()
+                for i in range(len(z)):
+                    rows.append([-z[i], s[i]] + ([seen[i]] if i else []))
+                    if i + 1 < len(z):
+                        rows.append([-seen[i + 1], z[i]] + ([seen[i]] if i else []))
+        return clause_array(rows)
+
+    def valid_inequality_clauses(self, encoding=None) -> np.ndarray:
+        return valid_inequality_clauses(self, encoding or self.cardinality, gamma_signs=self.gamma_neg)
+
+    def decode(self, assignment) -> MM_Scheme:
+        # Coefficients from a bool assignment indexed by variable id
+        assignment = np.asarray(assignment, dtype=bool)
+        factors = []
+        for nonzero, negative in ((self.alpha, self.alpha_neg), (self.beta, self.beta_neg),
+                                  (self.gamma, self.gamma_neg)):
+            factors.append(assignment[nonzero].astype(np.int8) * (1 - 2 * assignment[negative].astype(np.int8)))
+        return MM_Scheme(*factors)
@@ -1,22 +1,30 @@
+import os
 import time
+import numpy as np
 from datetime import datetime
 from z3 import *
-from functools import reduce
-from itertools import combinations
+from brent_cnf import BrentEncoder
+from cardinality import valid_inequality_clauses
+from instance_cache import InstanceCache
+from instrument import Recorder
+from mm_scheme import MM_Scheme
+from ternary_cnf import TernaryEncoder
 
-def in_order(vectorA, vectorB, mode):
-    # If vectorA is empty we are definitely in_order
-    if not vectorA:
-        return True
-    # If vectorB is empty while vectorA is not we are definitely **NOT** in_order
-    if not vectorB:
-        return False
-    # If neither are empty, compare the first elements and recurse
-    if mode == 'sat':
-        return Or(And(Not(vectorA[0]), vectorB[0]), And(vectorA[0] == vectorB[0], in_order(vectorA[1:], vectorB[1:], mode)))
-    elif mode == 'smt':
-        return Or(vectorA[0] < vectorB[0], And(vectorA[0] == vectorB[0], in_order(vectorA[1:], vectorB[1:], mode)))
+# sat: F_2 coefficients as Bools, smt: Int coefficients from a given set,
+# ternary-sat: {-1, 0, 1} coefficients over Z as pairs of Bools
+MODES = ('sat', 'smt', 'ternary-sat')
 
+def add_lex_leader(solver, vectorA, vectorB, name):
+    # Linear size lex constraint vectorA <= vectorB: eq_i is true while the
+    # vectors agree on the first i entries, and while they agree
+    # vectorA[i] <= vectorB[i]
+    equal = [Bool(f'{name}_eq{i}') for i in range(1, len(vectorA))]
+    before = [True] + equal
+    for i, (a, b) in enumerate(zip(vectorA, vectorB)):
+        leq = Or(Not(a), b) if is_bool(a) else a <= b
+        solver.add(Implies(before[i], leq))
+        if i < len(equal):
+            solver.add(Implies(And(before[i], a == b), equal[i]))
 
 def kron(i: int, j: int) -> int:
     if i == j:
@@ -24,159 +32,243 @@ def kron(i: int, j: int) -> int:
     else:
         return 0
 
-def is_atom(t):
-    if not is_bool(t):
-        return False
-    if not is_app(t):
-        return False
-    k = t.decl().kind()
-    if k == Z3_OP_AND or k == Z3_OP_OR or k == Z3_OP_IMPLIES:
-        return False
-    if k == Z3_OP_EQ and t.arg(0).is_bool():
-        return False
-    if k == Z3_OP_TRUE or k == Z3_OP_FALSE or k == Z3_OP_XOR or k == Z3_OP_NOT:
-        return False
-    return True
-
-def atoms(fml):
-    visited = set([])
-    atms = set([])
-    def atoms_rec(t, visited, atms):
-        if t in visited:
-            return
-        visited |= { t }
-        if is_atom(t):
-            atms |= { t }
-        for s in t.children():
-            atoms_rec(s, visited, atms)
-    atoms_rec(fml, visited, atms)
-    return atms
-
-def atom2literal(m, a):
-    if is_true(m.eval(a)):
-        return a
-    return Not(a)
+def add_cnf(solver, clauses, literals):
+    # Post integer clauses to a z3 solver, literals[v] is the Bool for
+    # variable v and variables without one are auxiliary Bools named k!v.
+    # The clauses are parsed by z3 from one SMT-LIB string, building an
+    # expression per clause through the Python API is what made posting slow.
+    # DIMACS text would parse faster, but z3 gives its variables fresh names
+    # that the literals (and so assumptions, warm starts and models) could not
+    # refer to. Returns the number of clauses posted, the solver sees each
+    # call as a single assertion.
+    if len(clauses) == 0:
+        return 0
+    clauses = np.asarray(clauses)
+    top = int(abs(clauses).max())
+    used = np.unique(np.abs(clauses))
+    used = used[used != 0].tolist()
+    named = [v for v in used if v < len(literals) and literals[v] is not None]
+    symbols = np.full(top + 1, '', dtype=object)
+    symbols[used] = [f'|k!{v}|' for v in used]
+    # The parser gets the literals as declarations, looking up their names
+    # would cost as much as building the clauses
+    symbols[named] = [f'x{v}' for v in named]
+    negated = np.full(top + 1, '', dtype=object)
+    negated[used] = [f'(not {symbol})' for symbol in symbols[used]]
+    auxiliary = np.setdiff1d(used, named).tolist()
+    text = np.where(clauses > 0, symbols[np.abs(clauses)], negated[np.abs(clauses)])
+    declarations = ''.join(f'(declare-const |k!{v}| Bool)' for v in auxiliary)
+    clauses = ' '.join(f'(or {" ".join(row).strip()})' for row in text.tolist())
+    solver.add(parse_smt2_string(f'{declarations}(assert (and {clauses}))',
+                                 decls={f'x{v}': literals[v] for v in named}))
+    return len(text)
 
-def implicant(atoms, s, snot):
-    m = snot.model()
-    lits = [atom2literal(m, a) for a in atoms]
-    is_sat = s.check(lits)
-    assert is_sat == unsat
-    core = s.unsat_core()
-    return Or([mk_not(c) for c in core])
+def load_dimacs(solver, path):
+    # Post a DIMACS file to a z3 solver. z3 only recognizes a DIMACS string
+    # that starts with the header, so comments go. Returns the clause count
+    # from the header.
+    with open(path) as file:
+        text = ''.join(line for line in file if not line.startswith('c'))
+    solver.from_string(text)
+    return int(text.split(None, 4)[3])
 
-def to_cnf(fml):
-    atms = atoms(fml)
-    s = Solver()
-    snot = Solver()
-    snot.add(Not(fml))
-    s.add(fml)
+def encoder_literals(encoder):
+    # Bools for the primary variables of an encoder, indexed by variable id
+    literals = [None] * (encoder.num_primary + 1)
+    for var, name in encoder.variable_names().items():
+        literals[var] = Bool(name)
+    return literals
 
-    while sat == snot.check():
-        clause = implicant(atms, s, snot)
-        yield clause
-        snot.add(clause)
+def model_assignment(model, literals):
+    # Values of the literals in a model as a bool array indexed by variable id
+    assignment = np.zeros(len(literals), dtype=bool)
+    for var, literal in enumerate(literals):
+        if literal is not None:
+            assignment[var] = is_true(model.eval(literal, model_completion=True))
+    return assignment
 
-def apply_tseitin(expr):
-    tseitin_cnf = Tactic('tseitin-cnf')
-    return tseitin_cnf(expr)
+def solver_statistics(solver):
+    # z3 statistics (conflicts, decisions, memory, ...) as a plain dict
+    statistics = solver.statistics()
+    return {key: statistics.get_key_value(key) for key in statistics.keys()}
 
-def exists_scheme(n, m, p, r, mode, coefficients):
+def build_solver(n, m, p, r, mode, coefficients, lex=None, lex_gamma=False, sign_sym=None, valid_ineq=None,
+                 cardinality='totalizer', recorder=None, cyclic=None, solver=None, cache=None):
+    # Solver holding the Brent equations and the chosen extra constraints,
+    # options left as None are asked for interactively. With a recorder
+    # every constraint family is timed and its size recorded. cyclic is the
+    # number of fixed terms of a cyclic-symmetric ansatz (see BrentEncoder).
+    # The constraints go into a new Solver unless one is given. With a cache
+    # (an InstanceCache) sat and ternary-sat mode load the cached DIMACS
+    # instance instead of encoding, its variables are not the named Bools, so
+    # such a solver only tells sat from unsat (no warm starts or models).
+    recorder = recorder or Recorder()
     nm_pairs = [(i,j) for i in range(n) for j in range(m)]
     mp_pairs = [(i,j) for i in range(m) for j in range(p)]
     np_pairs = [(i,j) for i in range(n) for j in range(p)]
-    solver = Solver()
+    solver = solver if solver is not None else Solver()
+    if cache is not None and mode in ('sat', 'ternary-sat'):
+        if lex is None:
+            lex = input('Add lex constr? y/n: ') in ['y', 'Y', 'yes', 'YES', 'Yes']
+        if mode == 'ternary-sat' and sign_sym is None:
+            sign_sym = input('Add sign sym? y/n: ') in ['y', 'Y', 'yes', 'YES', 'Yes']
+        if valid_ineq is None:
+            valid_ineq = input('Add valid ineq? y/n: ') in ['y', 'Y', 'yes', 'YES', 'Yes']
+        with recorder.phase('instance'):
+            # lex_gamma only counts together with lex, as below
+            path = cache.instance(n, m, p, r, ternary=mode == 'ternary-sat', lex=lex, lex_gamma=lex and lex_gamma,
+                                  valid_ineq=valid_ineq, cardinality=cardinality, sign_sym=sign_sym, cyclic=cyclic)
+        with recorder.phase('load_dimacs') as record:
+            record['clauses'] = load_dimacs(solver, path)
+        return solver
     variables = {}
     var_names = []
-    for l in range(r):
-        def add_variable(name):
-            if mode == 'sat':
-                var = Bool(name)
-                variables[name] = var
-                var_names.append(name)
-            elif mode == 'smt':
-                var = Int(name)
-                variables[name] = var
-                var_names.append(name)
-                solver.add(Or([var == x for x in coefficients]))
-        for i1, i2 in nm_pairs:
-            var_name = f'a{i1}{i2}^{l}'
-            add_variable(var_name)
-        for j1, j2 in mp_pairs:
-            var_name = f'b{j1}{j2}^{l}'
-            add_variable(var_name)
-        for k1, k2 in np_pairs:
-            var_name = f'c{k1}{k2}^{l}'
-            add_variable(var_name)
-    for i1, i2 in nm_pairs:
-        for j1, j2 in mp_pairs:
+    encoder = None
+    with recorder.phase('variables', solver):
+        for l in range(r):
+            def add_variable(name):
+                if mode == 'sat':
+                    var = Bool(name)
+                    variables[name] = var
+                    var_names.append(name)
+                elif mode == 'ternary-sat':
+                    # Two bits per coefficient: nonzero and negative
+                    for suffix in ('_nz', '_neg'):
+                        variables[name + suffix] = Bool(name + suffix)
+                    var_names.append(name)
+                elif mode == 'smt':
+                    var = Int(name)
+                    variables[name] = var
+                    var_names.append(name)
+                    solver.add(Or([var == x for x in coefficients]))
+            for i1, i2 in nm_pairs:
+                var_name = f'a{i1}{i2}^{l}'
+                add_variable(var_name)
+            for j1, j2 in mp_pairs:
+                var_name = f'b{j1}{j2}^{l}'
+                add_variable(var_name)
             for k1, k2 in np_pairs:
-                if mode=='sat':
-                    and_exprs = []
-                    for l in range(r):
-                        and_exprs.append(And(variables[f'a{i1}{i2}^{l}'],
-                            variables[f'b{j1}{j2}^{l}'],
-                            variables[f'c{k1}{k2}^{l}']))
-                    lhs = reduce(lambda x, y: Xor(x, y), and_exprs)
-                    rhs = kron(i2,j1)*kron(i1,k1)*kron(j2,k2)
-                    formula = lhs
-                    if rhs == 0:
-                        formula = Not(lhs)
-                    goal = Goal()
-                    goal.add(formula)
-                    formula_cnf = apply_tseitin(formula)
-                    for clause in formula_cnf:
-                        solver.add(clause)
-                elif mode=='smt':
-                    prod_exprs = []
-                    for idx in range(0, r):
-                        prod_exprs.append(
-                            variables['a{}{}^{}'.format(i1, i2, idx)] *
-                            variables['b{}{}^{}'.format(j1, j2, idx)] *
-                            variables['c{}{}^{}'.format(k1, k2, idx)])
-                    lhs = sum(prod_exprs)
-                    rhs = kron(i2, j1) * kron(i1, k1) * kron(j2, k2)
-                    solver.add(lhs == rhs)
-                else:
-                    raise Exception(f'Invalid mode: {mode}')
-    if input('Add lex constr? y/n: ') in ['y', 'Y', 'yes', 'YES', 'Yes']:
-        def add_lexicographic_constraint():
-            for l in range(0, r-1):
-                vector_l = []
-                vector_l_plus_one = []
-                for i1, i2 in nm_pairs:
-                    vector_l.append(variables[f'a{i1}{i2}^{l}'])
-                    vector_l_plus_one.append(variables[f'a{i1}{i2}^{l+1}'])
+                var_name = f'c{k1}{k2}^{l}'
+                add_variable(var_name)
+    # CNF phases count clauses, add_cnf posts a whole chunk as one assertion
+    with recorder.phase('brent_equations', solver if mode == 'smt' else None) as record:
+        if mode in ('sat', 'ternary-sat'):
+            # Tseitin clauses come straight from the integer encoder, no tactic calls
+            if mode == 'sat':
+                encoder = BrentEncoder(n, m, p, r, cyclic)
+            else:
+                encoder = TernaryEncoder(n, m, p, r, cardinality, cyclic)
+            literals = [None] * (encoder.num_primary + 1)
+            for var, name in encoder.variable_names().items():
+                literals[var] = variables[name]
+            record['clauses'] = sum(add_cnf(solver, clauses, literals) for clauses in encoder.clauses())
+            record['variables'] = encoder.num_vars
+        elif mode == 'smt':
+            equations = None
+            if cyclic is not None:
+                # The encoder only provides the shared ids and the equation
+                # orbits, the ansatz becomes equalities between coefficients
+                encoder = BrentEncoder(n, m, p, r, cyclic)
+                names = encoder.variable_names()
+                for symbol, factor in zip('abc', (encoder.alpha, encoder.beta, encoder.gamma)):
+                    for (l, i, j), var in np.ndenumerate(factor):
+                        name = f'{symbol}{i}{j}^{l}'
+                        if name != names[int(var)]:
+                            solver.add(variables[name] == variables[names[int(var)]])
+                equations = set(encoder.equations.tolist())
+            for i1, i2 in nm_pairs:
                 for j1, j2 in mp_pairs:
-                    vector_l.append(variables[f'b{j1}{j2}^{l}'])
-                    vector_l_plus_one.append(variables[f'b{j1}{j2}^{l+1}'])
-                if mode == 'sat':
-                    cnf_lex = to_cnf(in_order(vector_l, vector_l_plus_one, mode))
-                    for clause in cnf_lex:
-                        solver.add(clause)
-                else:
-                    solver.add(in_order(vector_l, vector_l_plus_one, mode))
-        add_lexicographic_constraint()
+                    for k1, k2 in np_pairs:
+                        if equations is not None and \
+                                ((i1 * m + i2) * m * p + j1 * p + j2) * n * p + k1 * p + k2 not in equations:
+                            continue
+                        prod_exprs = []
+                        for idx in range(0, r):
+                            prod_exprs.append(
+                                variables['a{}{}^{}'.format(i1, i2, idx)] *
+                                variables['b{}{}^{}'.format(j1, j2, idx)] *
+                                variables['c{}{}^{}'.format(k1, k2, idx)])
+                        lhs = sum(prod_exprs)
+                        rhs = kron(i2, j1) * kron(i1, k1) * kron(j2, k2)
+                        solver.add(lhs == rhs)
+        else:
+            raise Exception(f'Invalid mode: {mode}')
+    if lex is None:
+        lex = input('Add lex constr? y/n: ') in ['y', 'Y', 'yes', 'YES', 'Yes']
+    if lex:
+        def add_lexicographic_constraint():
+            if mode in ('sat', 'ternary-sat'):
+                return add_cnf(solver, encoder.lex_clauses(include_gamma=lex_gamma), literals)
+            else:
+                groups = encoder.symmetric_terms if encoder is not None else [list(range(r))]
+                for l, l_next in [pair for terms in groups for pair in zip(terms, terms[1:])]:
+                    vector_l = []
+                    vector_l_plus_one = []
+                    for i1, i2 in nm_pairs:
+                        vector_l.append(variables[f'a{i1}{i2}^{l}'])
+                        vector_l_plus_one.append(variables[f'a{i1}{i2}^{l_next}'])
+                    for j1, j2 in mp_pairs:
+                        vector_l.append(variables[f'b{j1}{j2}^{l}'])
+                        vector_l_plus_one.append(variables[f'b{j1}{j2}^{l_next}'])
+                    if lex_gamma:
+                        for k1, k2 in np_pairs:
+                            vector_l.append(variables[f'c{k1}{k2}^{l}'])
+                            vector_l_plus_one.append(variables[f'c{k1}{k2}^{l_next}'])
+                    add_lex_leader(solver, vector_l, vector_l_plus_one, f'lex^{l}')
+        if mode == 'smt':
+            with recorder.phase('lex', solver):
+                add_lexicographic_constraint()
+        else:
+            with recorder.phase('lex', encoder=encoder) as record:
+                record['clauses'] = add_lexicographic_constraint()
+    if mode == 'ternary-sat':
+        # Sign symmetries and valid inequalities on the nonzero/negative bits
+        if sign_sym is None:
+            sign_sym = input('Add sign sym? y/n: ') in ['y', 'Y', 'yes', 'YES', 'Yes']
+        if sign_sym:
+            with recorder.phase('sign_symmetries', encoder=encoder) as record:
+                record['clauses'] = add_cnf(solver, encoder.sign_symmetry_clauses(), literals)
+        if valid_ineq is None:
+            valid_ineq = input('Add valid ineq? y/n: ') in ['y', 'Y', 'yes', 'YES', 'Yes']
+        if valid_ineq:
+            with recorder.phase('valid_inequalities', encoder=encoder) as record:
+                record['clauses'] = add_cnf(solver, encoder.valid_inequality_clauses(), literals)
+    if mode == 'sat':
+        if valid_ineq is None:
+            valid_ineq = input('Add valid ineq? y/n: ') in ['y', 'Y', 'yes', 'YES', 'Yes']
+        if valid_ineq:
+            with recorder.phase('valid_inequalities', encoder=encoder) as record:
+                record['clauses'] = add_cnf(solver, valid_inequality_clauses(encoder, cardinality), literals)
     if mode == 'smt':
-        if input('Add sign sym? y/n: ') in ['y', 'Y', 'yes', 'YES', 'Yes']:
+        if sign_sym is None:
+            sign_sym = input('Add sign sym? y/n: ') in ['y', 'Y', 'yes', 'YES', 'Yes']
+        if sign_sym and cyclic is not None:
+            raise ValueError('Sign symmetries are not compatible with the cyclic ansatz')
+        if sign_sym:
             def add_sign_symmetries():
+                # Flipping the signs of two of a term's factors leaves the
+                # term alone, so the first nonzero alpha and gamma entries of
+                # every term can be taken nonpositive
                 for i_r in range(0, r):
-                    solver.add(variables[f'a00^{0}'] <= 0)
+                    solver.add(variables[f'a00^{i_r}'] <= 0)
                     for idx_outer, (i1, i2) in enumerate(nm_pairs):
                         if (i1, i2) != (0, 0):
                             sum_abs = Abs(variables[f'a00^{i_r}'])
                             for idx_inner, (i1p, i2p) in enumerate(nm_pairs[1:idx_outer]):
                                 sum_abs += Abs(variables[f'a{i1p}{i2p}^{i_r}'])
-                            solver.add(variables[f'a{i1}{i2}^{l}'] <= sum_abs)
-                    solver.add(variables[f'c00^{0}'] <= 0)
-                    for idx_outer, (i1, i2) in enumerate(nm_pairs):
-                        if (i1, i2) != (0, 0):
-                            sum_abs = Abs(variables[f'c00^{l}'])
-                            for idx_inner, (i1p, i2p) in enumerate(nm_pairs[1:idx_outer]):
-                                sum_abs += Abs(variables[f'c{i1p}{i2p}^{i_r}'])
-                            solver.add(variables[f'c{i1}{i2}^{l}'] <= sum_abs)
-            add_sign_symmetries()
-        if input('Add valid ineq? y/n: ') in ['y', 'Y', 'yes', 'YES', 'Yes']:
+                            solver.add(variables[f'a{i1}{i2}^{i_r}'] <= sum_abs)
+                    solver.add(variables[f'c00^{i_r}'] <= 0)
+                    for idx_outer, (k1, k2) in enumerate(np_pairs):
+                        if (k1, k2) != (0, 0):
+                            sum_abs = Abs(variables[f'c00^{i_r}'])
+                            for idx_inner, (k1p, k2p) in enumerate(np_pairs[1:idx_outer]):
+                                sum_abs += Abs(variables[f'c{k1p}{k2p}^{i_r}'])
+                            solver.add(variables[f'c{k1}{k2}^{i_r}'] <= sum_abs)
+            with recorder.phase('sign_symmetries', solver, encoder):
+                add_sign_symmetries()
+        if valid_ineq is None:
+            valid_ineq = input('Add valid ineq? y/n: ') in ['y', 'Y', 'yes', 'YES', 'Yes']
+        if valid_ineq:
             def add_valid_inequalities():
                 for l in range(0, r):
                     sum_abs = Abs(variables[f'c00^{l}'])
@@ -219,12 +311,80 @@ def exists_scheme(n, m, p, r, mode, coefficients):
                     for l in range(1, r):
                         sum_abs += Abs(variables[f'a{i1}{i2}^{l}'] * variables[f'b{j1}{j2}^{l}'])
                     solver.add(sum_abs >= 1)
-            add_valid_inequalities()
+            with recorder.phase('valid_inequalities', solver, encoder):
+                add_valid_inequalities()
+    return solver
+
+def warm_start(solver, encoder, literals, start, fix=()):
+    # Phase hints for every variable start assigns, start being an MM_Scheme
+    # (see BrentEncoder.scheme_assignment) or a dict of coefficients by name.
+    # The term slots in fix are tied to their start values behind one guard
+    # literal each, the guards are returned to be assumed by check_relaxed.
+    if isinstance(start, MM_Scheme):
+        assignment = encoder.scheme_assignment(start)
+    else:
+        assignment = encoder.coefficient_assignment(start)
+    for var, value in assignment.items():
+        solver.set_initial_value(literals[var], BoolVal(value))
+    guards = []
+    for l in fix:
+        guard = Bool(f'fix^{l}')
+        for var in encoder.term_variables(l).tolist():
+            if var in assignment:
+                literal = literals[var]
+                solver.add(Or(Not(guard), literal if assignment[var] else Not(literal)))
+        guards.append(guard)
+    return guards
 
+def check_relaxed(solver, guards):
+    # Check under the guards, dropping the guards of every unsat core until
+    # the check succeeds. Returns the result and the guards that were kept,
+    # unsat with no guards left means unsat without the warm start too.
+    guards = list(guards)
+    while True:
+        result = solver.check(guards)
+        if result != unsat or not guards:
+            return result, guards
+        core = solver.unsat_core()
+        kept = [guard for guard in guards if not any(guard.eq(x) for x in core)]
+        if len(kept) == len(guards):
+            return result, guards
+        guards = kept
+
+def exists_scheme(n, m, p, r, mode, coefficients, lex=None, lex_gamma=False, sign_sym=None, valid_ineq=None,
+                  cardinality='totalizer', seed=None, recorder=None, cyclic=None, start=None, fix=()):
+    # start and fix warm start the search, see warm_start. Without a warm
+    # start the instance comes from the instance cache.
+    recorder = recorder or Recorder()
+    # Initial values are only accepted by the SMT core, which Solver() also
+    # switches to once there are assumptions
+    solver = build_solver(n, m, p, r, mode, coefficients, lex, lex_gamma, sign_sym, valid_ineq, cardinality,
+                          recorder, cyclic, SimpleSolver() if start is not None else None,
+                          InstanceCache() if start is None else None)
+    guards = []
+    if start is not None:
+        # Same ids and names as the encoder build_solver used
+        if mode == 'sat':
+            encoder = BrentEncoder(n, m, p, r, cyclic)
+        elif mode == 'ternary-sat':
+            encoder = TernaryEncoder(n, m, p, r, cardinality, cyclic)
+        else:
+            raise Exception(f'Invalid mode for a warm start: {mode}')
+        with recorder.phase('warm_start', solver) as record:
+            guards = warm_start(solver, encoder, encoder_literals(encoder), start, fix)
+            record['fixed_terms'] = len(guards)
+    if seed is not None:
+        solver.set(random_seed=seed)
     t0 = time.time() # Start time
     now = datetime.now().strftime('%H:%M')
     print(f'Starting solver at time: {now}')
-    result = solver.check()
+    with recorder.phase('solve') as record:
+        result, kept = check_relaxed(solver, guards)
+        if guards:
+            print(f'{len(guards) - len(kept)} of {len(guards)} fixed terms relaxed')
+            record['relaxed_terms'] = len(guards) - len(kept)
+        record['result'] = str(result)
+        record['statistics'] = solver_statistics(solver)
     print(f'Result: {result}')
     t1 = time.time() # End time
     t_elapsed = t1 - t0 # Delta time
@@ -234,6 +394,127 @@ def exists_scheme(n, m, p, r, mode, coefficients):
         file.writelines([f'Mode: {mode} | Coef: {coefficients} | Dim: {n} {m} {p} {r} | Time: {t_elapsed}s | {result}\n'])
     return result
 
+def descend_rank(n, m, p, r_max, mode='sat', lex=True, lex_gamma=False, sign_sym=False,
+                 cardinality='totalizer', save_dir=None):
+    # Encode r_max terms once and walk the rank down on the same solver, so
+    # learned clauses carry over. Term l is switched off by assuming Not(on_l),
+    # which forces all its variables to false. Zero terms are lex smallest, so
+    # dropping the first terms keeps the lex constraint satisfiable.
+    if mode == 'sat':
+        encoder = BrentEncoder(n, m, p, r_max)
+    elif mode == 'ternary-sat':
+        encoder = TernaryEncoder(n, m, p, r_max, cardinality)
+    else:
+        raise Exception(f'Invalid mode for rank descent: {mode}')
+    coefficients = [0,1] if mode == 'sat' else [-1,0,1]
+    solver = Solver()
+    literals = encoder_literals(encoder)
+    for clauses in encoder.clauses():
+        add_cnf(solver, clauses, literals)
+    if lex:
+        add_cnf(solver, encoder.lex_clauses(include_gamma=lex_gamma), literals)
+    if mode == 'ternary-sat' and sign_sym:
+        add_cnf(solver, encoder.sign_symmetry_clauses(), literals)
+    active = [Bool(f'on^{l}') for l in range(r_max)]
+    for l, on in enumerate(active):
+        for var in encoder.term_variables(l).tolist():
+            solver.add(Or(on, Not(literals[var])))
+
+    # One (rank, result, seconds, scheme or core) record per check, where the
+    # core lists the switched off terms the unsat proof needed
+    records = []
+    r = r_max
+    while r > 0:
+        t0 = time.time()
+        result = solver.check([Not(on) for on in active[:r_max - r]])
+        t_elapsed = time.time() - t0
+        print(f'Rank {r}: {result} ({t_elapsed:.2f} seconds)')
+        with open('results.info', 'a') as file:
+            file.writelines([f'Mode: {mode} descent | Coef: {coefficients} | Dim: {n} {m} {p} {r} | '
+                             f'Time: {t_elapsed}s | {result}\n'])
+        if result == sat:
+            scheme = encoder.decode(model_assignment(solver.model(), literals)).drop_zero_terms()
+            records.append((r, result, t_elapsed, scheme))
+            if save_dir is not None:
+                os.makedirs(save_dir, exist_ok=True)
+                scheme.save(os.path.join(save_dir, f'{n}{m}{p}_r{scheme.rank}.npz'))
+            # The model may already use fewer terms than allowed
+            r = scheme.rank - 1
+        elif result == unsat:
+            core = [expr.arg(0) for expr in solver.unsat_core()]
+            core = [l for l, on in enumerate(active) if any(on.eq(x) for x in core)]
+            print(f'Switched off terms in the unsat core: {core}')
+            records.append((r, result, t_elapsed, core))
+            break
+        else:
+            records.append((r, result, t_elapsed, None))
+            break
+    return records
+
+def lazy_scheme(n, m, p, r, mode='sat', sample=0.05, lex=True, lex_gamma=False, sign_sym=False,
+                cardinality='totalizer', seed=0, recorder=None):
+    # Counterexample guided solving: only the equations with right hand side 1
+    # and a random sample of the others (a fraction sample of them) are
+    # posted at first. Every model is checked against all equations and the
+    # violated ones are added before the next incremental check. An unsat
+    # answer on a subset of the equations already proves that no scheme
+    # exists, a model violating nothing is a scheme. Returns (result, scheme
+    # or None).
+    recorder = recorder or Recorder()
+    if mode == 'sat':
+        encoder = BrentEncoder(n, m, p, r)
+    elif mode == 'ternary-sat':
+        encoder = TernaryEncoder(n, m, p, r, cardinality)
+    else:
+        raise Exception(f'Invalid mode for lazy equations: {mode}')
+    field = 'F2' if mode == 'sat' else 'Z'
+    coefficients = [0,1] if mode == 'sat' else [-1,0,1]
+    solver = Solver()
+    literals = encoder_literals(encoder)
+    if mode == 'ternary-sat':
+        add_cnf(solver, encoder.coefficient_clauses(), literals)
+    if lex:
+        add_cnf(solver, encoder.lex_clauses(include_gamma=lex_gamma), literals)
+    if mode == 'ternary-sat' and sign_sym:
+        add_cnf(solver, encoder.sign_symmetry_clauses(), literals)
+    rng = np.random.default_rng(seed)
+    zero = np.flatnonzero(encoder.rhs[encoder.equations] == 0)
+    posted = np.zeros(len(encoder.equations), dtype=bool)
+    posted[np.flatnonzero(encoder.rhs[encoder.equations] == 1)] = True
+    posted[rng.choice(zero, int(round(sample * len(zero))), replace=False)] = True
+    positions = np.flatnonzero(posted)
+    t0 = time.time()
+    rounds = 0
+    while True:
+        with recorder.phase('brent_equations', encoder=encoder, round=rounds) as record:
+            record['clauses'] = sum(add_cnf(solver, encoder.equation_clauses(positions[start:start + 64]), literals)
+                                    for start in range(0, len(positions), 64))
+            record['equations'] = len(positions)
+        with recorder.phase('solve') as record:
+            result = solver.check()
+            record['result'] = str(result)
+        rounds += 1
+        if result != sat:
+            scheme = None
+            break
+        scheme = encoder.decode(model_assignment(solver.model(), literals))
+        violated = scheme.verify(field)
+        if len(violated) == 0:
+            break
+        # Rows (i1, i2, j1, j2, k1, k2) back to flat equation indices
+        i1, i2, j1, j2, k1, k2 = violated.T
+        eq = ((i1 * m + i2) * m * p + j1 * p + j2) * n * p + k1 * p + k2
+        positions = np.searchsorted(encoder.equations, eq)
+        posted[positions] = True
+        print(f'Round {rounds}: {len(violated)} violated equations added, {posted.sum()}/{len(posted)} posted')
+    t_elapsed = time.time() - t0
+    print(f'Result: {result} after {rounds} rounds with {posted.sum()}/{len(posted)} equations '
+          f'({t_elapsed:.2f} seconds)')
+    with open('results.info', 'a') as file:
+        file.writelines([f'Mode: {mode} lazy | Coef: {coefficients} | Dim: {n} {m} {p} {r} | Time: {t_elapsed}s | '
+                         f'{result}\n'])
+    return str(result), scheme
+
 def get_args():
     if len(sys.argv) >= 5:
         try:
@@ -253,15 +534,38 @@ def get_args():
 def main():
     n, m, p, r = get_args()
     mode = None
-    while mode!='sat' and mode!='smt':
-        mode = input('What mode would you like to use? sat/smt: ')
-        if mode!='sat' and mode!='smt':
+    while mode not in MODES:
+        mode = input('What mode would you like to use? sat/smt/ternary-sat: ')
+        if mode not in MODES:
             print('Invalid input.')
     if mode=='smt':
         coefficients = [int(x) for x in input('Please enter desired coefficients. For all integers press \'enter\': ').split()]
+    elif mode=='ternary-sat':
+        coefficients = [-1,0,1]
     else:
         coefficients = [0,1]
-    exists_scheme(n, m, p, r, mode, coefficients)
+    if mode != 'smt' and input('Walk the rank down from r? y/n: ') in ['y', 'Y', 'yes', 'YES', 'Yes']:
+        descend_rank(n, m, p, r, mode, save_dir='schemes')
+    elif mode != 'smt' and input('Add the Brent equations lazily? y/n: ') in ['y', 'Y', 'yes', 'YES', 'Yes']:
+        result, scheme = lazy_scheme(n, m, p, r, mode)
+        if scheme is not None:
+            scheme = scheme.drop_zero_terms()
+            os.makedirs('schemes', exist_ok=True)
+            scheme.save(os.path.join('schemes', f'{n}{m}{p}_r{scheme.rank}.npz'))
+    else:
+        cyclic = None
+        if n == m == p and input('Only cyclic-symmetric schemes? y/n: ') in ['y', 'Y', 'yes', 'YES', 'Yes']:
+            # As few fixed terms as the rank allows
+            cyclic = r % 3
+        start, fix = None, ()
+        if mode != 'smt':
+            filename = input('Warm start from a scheme file? Path or \'enter\' for none: ')
+            if filename:
+                start = MM_Scheme.load(filename)
+                # Its nonzero terms fill the last slots
+                fixed = int(input('How many of its terms to fix (relaxed as needed)? ') or 0)
+                fix = range(r - min(fixed, r), r)
+        exists_scheme(n, m, p, r, mode, coefficients, cyclic=cyclic, start=start, fix=fix)
 
 if __name__ == "__main__":
     main()
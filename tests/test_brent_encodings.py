@@ -0,0 +1,19 @@
+import pytest
+from z3 import sat, unsat
+from z3_solve import build_solver
+
+@pytest.mark.parametrize('mode', ['sat', 'ternary-sat', 'smt'])
+def test_rank_of_1x2x2(mode):
+    # <1,2,2> has rank 4, with or without the symmetry breaking constraints
+    coefficients = [0, 1] if mode == 'sat' else [-1, 0, 1]
+    for lex, valid_ineq in ((False, False), (True, True)):
+        for r, expected in ((3, unsat), (4, sat)):
+            solver = build_solver(1, 2, 2, r, mode, coefficients, lex=lex, sign_sym=lex, valid_ineq=valid_ineq)
+            assert solver.check() == expected
+
+@pytest.mark.parametrize('mode', ['ternary-sat', 'smt'])
+def test_sign_symmetries_of_2x2x1(mode):
+    # alpha and gamma have different shapes here
+    for r, expected in ((3, unsat), (4, sat)):
+        solver = build_solver(2, 2, 1, r, mode, [-1, 0, 1], lex=False, sign_sym=True, valid_ineq=True)
+        assert solver.check() == expected
@@ -0,0 +1,39 @@
+import itertools
+import numpy as np
+import pytest
+from z3 import Bool, Not, Solver, sat, unsat
+from cardinality import ENCODINGS, at_least_k, at_most_k, exactly_k, family_encodings
+from z3_solve import add_cnf, build_solver
+
+@pytest.mark.parametrize('encoding', sorted(ENCODINGS))
+@pytest.mark.parametrize('bound', ['at_most', 'at_least', 'exactly'])
+def test_cardinality_brute_force(encoding, bound):
+    # Every assignment of n <= 6 literals extends to a model of the clauses
+    # exactly when it meets the bound
+    for n in range(1, 7):
+        for k in range(0, n + 1):
+            top = [n]
+            def new_vars(count):
+                top[0] += count
+                return np.arange(top[0] - count + 1, top[0] + 1, dtype=np.int32)
+            constraint = {'at_most': at_most_k, 'at_least': at_least_k, 'exactly': exactly_k}[bound]
+            clauses = constraint(np.arange(1, n + 1), k, new_vars, encoding)
+            solver = Solver()
+            literals = [None] + [Bool(f'x{v}') for v in range(1, n + 1)]
+            add_cnf(solver, clauses, literals)
+            for values in itertools.product((False, True), repeat=n):
+                assumptions = [x if value else Not(x) for x, value in zip(literals[1:], values)]
+                expected = {'at_most': sum(values) <= k, 'at_least': sum(values) >= k,
+                            'exactly': sum(values) == k}[bound]
+                assert (solver.check(assumptions) == sat) == expected, (n, k, values)
+
+def test_valid_inequalities_per_family():
+    # Families left out of the dict keep the totalizer
+    encodings = {9: 'sequential', '10': 'sorting_network'}
+    assert family_encodings(encodings) == {9: 'sequential', 10: 'sorting_network'}
+    assert family_encodings({10: 'cheapest'}) == {9: 'totalizer', 10: 'cheapest'}
+    with pytest.raises(ValueError):
+        family_encodings({8: 'totalizer'})
+    for r, expected in ((3, unsat), (4, sat)):
+        solver = build_solver(1, 2, 2, r, 'sat', [0, 1], lex=False, valid_ineq=True, cardinality=encodings)
+        assert solver.check() == expected
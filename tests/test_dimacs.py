@@ -0,0 +1,32 @@
+import pytest
+from z3 import Solver, is_true, sat
+from dimacs import decode_scheme, load_sign_map, load_variable_map, read_solution, variable_map_path
+from instance_cache import write_instance
+
+@pytest.mark.parametrize('ternary, dimension, r', [(False, (2, 2, 2), 7), (True, (1, 2, 2), 4)])
+def test_dimacs_round_trip(tmp_path, ternary, dimension, r):
+    # Write an instance, solve it, print the model as solver output and decode
+    # it through the variable map sidecar into a valid scheme
+    path = str(tmp_path / 'instance.cnf')
+    write_instance(path, *dimension, r, lex=True, ternary=ternary, sign_sym=ternary)
+    solver = Solver()
+    with open(path) as file:
+        solver.from_string(''.join(line for line in file if not line.startswith('c')))
+    assert solver.check() == sat
+    model = solver.model()
+    values = sorted((int(decl.name()[2:]), is_true(model[decl])) for decl in model.decls())
+    lines = ['s SATISFIABLE\n', 'v ' + ' '.join(str(var if value else -var) for var, value in values) + ' 0\n']
+    status, assignment = read_solution(lines)
+    assert status == 'SATISFIABLE'
+    scheme = decode_scheme(assignment, *load_variable_map(variable_map_path(path)),
+                           load_sign_map(variable_map_path(path)))
+    assert scheme.dimension == dimension and scheme.rank == r
+    assert scheme.is_valid('Z' if ternary else 'F2')
+
+def test_decode_partial_model(tmp_path):
+    path = str(tmp_path / 'instance.cnf')
+    write_instance(path, 1, 2, 2, 4)
+    alpha, beta, gamma = load_variable_map(variable_map_path(path))
+    status, assignment = read_solution(['s SATISFIABLE\n', f'v {" ".join(map(str, range(1, int(gamma.max()))))} 0\n'])
+    with pytest.raises(ValueError, match=str(int(gamma.max()))):
+        decode_scheme(assignment, alpha, beta, gamma)
@@ -0,0 +1,17 @@
+import pytest
+from instrument import Recorder
+from z3_solve import lazy_scheme
+
+@pytest.mark.parametrize('mode, field', [('sat', 'F2'), ('ternary-sat', 'Z')])
+def test_lazy_scheme(tmp_path, monkeypatch, mode, field):
+    # lazy_scheme appends to results.info in the working directory
+    monkeypatch.chdir(tmp_path)
+    recorder = Recorder()
+    result, scheme = lazy_scheme(2, 2, 2, 7, mode, recorder=recorder)
+    assert result == 'sat'
+    assert scheme.is_valid(field)
+    # The first model violates equations that were not posted, so they are
+    # added and solved again
+    assert sum(record['phase'] == 'solve' for record in recorder.records) > 1
+    result, scheme = lazy_scheme(1, 2, 2, 3, mode)
+    assert result == 'unsat' and scheme is None
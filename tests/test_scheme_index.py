@@ -0,0 +1,32 @@
+import numpy as np
+from mm_scheme import MM_Scheme, standard_scheme
+from scheme_index import canonical_form
+
+def transform(scheme, P, Q, R, P_inv, Q_inv, R_inv, order):
+    # (U, V, W) -> (P U Q, Q^-1 V R, P^-T W R^-T) with the terms reordered
+    U = np.einsum('ij,ljk,km->lim', P, scheme.U, Q)
+    V = np.einsum('ij,ljk,km->lim', Q_inv, scheme.V, R)
+    W = np.einsum('ij,ljk,km->lim', P_inv.T, scheme.W, R_inv.T)
+    return MM_Scheme(U[order], V[order], W[order])
+
+def test_canonical_form_invariance():
+    rng = np.random.default_rng(0)
+    # Over Z: signed permutation sandwiches and (a, b, c) -> (-a, -b, c)
+    scheme = standard_scheme(2, 2, 3)
+    def signed_permutation(k):
+        return np.eye(k, dtype=np.int64)[rng.permutation(k)] * rng.choice([-1, 1], size=k)
+    P, Q, R = signed_permutation(2), signed_permutation(2), signed_permutation(3)
+    image = transform(scheme, P, Q, R, P.T, Q.T, R.T, rng.permutation(scheme.rank))
+    signs = rng.choice([-1, 1], size=image.rank)[:, None, None]
+    image = MM_Scheme(image.U * signs, image.V * signs, image.W)
+    assert image.is_valid('Z')
+    assert canonical_form(image, 'Z') == canonical_form(scheme, 'Z')
+    # Over F_2: invertible sandwiches
+    P = np.array([[1, 1], [0, 1]])
+    Q = np.array([[0, 1], [1, 1]])
+    Q_inv = np.array([[1, 1], [1, 0]])
+    R = np.array([[1, 0, 1], [0, 1, 0], [0, 0, 1]])
+    image = transform(scheme, P, Q, R, P, Q_inv, R, rng.permutation(scheme.rank))
+    image = MM_Scheme(image.U % 2, image.V % 2, image.W % 2)
+    assert image.is_valid('F2')
+    assert canonical_form(image, 'F2') == canonical_form(scheme, 'F2')